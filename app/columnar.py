@@ -0,0 +1,191 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, Optional
+
+CODE_WIDTH = 11
+COUNTRY_WIDTH = 2
+# String id of a NULL bankName/address/countryName
+NO_STRING = 0xFFFFFFFF
+# Every BLOCK_SIZE-th code is kept in a list so most of a lookup is a bisect in
+# C, only the last steps go through FixedWidth
+BLOCK_SIZE = 64
+
+
+class StringTable:
+    # Deduplicated strings stored back to back as UTF-8 in one blob, string i
+    # is blob[offsets[i]:offsets[i + 1]]
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get(self, string_id: int) -> Optional[str]:
+        if string_id == NO_STRING:
+            return None
+        start, end = self.offsets[string_id], self.offsets[string_id + 1]
+        return str(self.blob[start:end], "utf-8")
+
+
+class StringTableBuilder:
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+        self.offsets = array("I", [0])
+        self.blob = bytearray()
+
+    def intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return NO_STRING
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.offsets) - 1
+            self.blob += value.encode()
+            self.offsets.append(len(self.blob))
+        return string_id
+
+    def build(self) -> StringTable:
+        return StringTable(self.offsets, bytes(self.blob))
+
+
+class FixedWidth:
+    # Sequence view of fixed width records in one bytes-like buffer, so bisect
+    # can search it without unpacking the whole column
+
+    def __init__(self, buffer, width: int):
+        self.buffer = buffer
+        self.width = width
+
+    def __len__(self):
+        return len(self.buffer) // self.width
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self.buffer[i * self.width : (i + 1) * self.width])
+
+
+def fits(item: dict) -> bool:
+    # Rows the fixed width columns cannot hold are kept outside the store
+    code, country = item["swiftCode"], item["countryISO2"]
+    return (
+        code.isascii()
+        and len(code) == CODE_WIDTH
+        and country is not None
+        and country.isascii()
+        and len(country) == COUNTRY_WIDTH
+    )
+
+
+class ColumnarStore:
+    # Read-only directory sorted by swiftCode, one column per field:
+    #   codes         n * 11 bytes, ASCII
+    #   countries     n * 2 bytes, ASCII
+    #   hq            1 bit per row
+    #   bank_names, addresses, country_names
+    #                 uint32 ids into one deduplicated string table
+    # Rows are only turned into dicts when they are returned.
+
+    def __init__(
+        self,
+        codes,
+        countries,
+        hq,
+        bank_names,
+        addresses,
+        country_names,
+        strings: StringTable,
+    ):
+        self.codes = FixedWidth(codes, CODE_WIDTH)
+        self.countries = countries
+        self.hq = hq
+        self.bank_names = bank_names
+        self.addresses = addresses
+        self.country_names = country_names
+        self.strings = strings
+        self.block_index = [
+            self.codes[i] for i in range(0, len(self.codes), BLOCK_SIZE)
+        ]
+
+    @classmethod
+    def build(cls, rows: Iterable[dict]) -> "ColumnarStore":
+        # rows must be sorted by swiftCode and pass fits()
+        codes = bytearray()
+        countries = bytearray()
+        hq = bytearray()
+        bank_names = array("I")
+        addresses = array("I")
+        country_names = array("I")
+        strings = StringTableBuilder()
+        for i, item in enumerate(rows):
+            codes += item["swiftCode"].encode("ascii")
+            countries += item["countryISO2"].encode("ascii")
+            if i % 8 == 0:
+                hq.append(0)
+            if item["isHeadquarter"]:
+                hq[-1] |= 1 << (i % 8)
+            bank_names.append(strings.intern(item["bankName"]))
+            addresses.append(strings.intern(item["address"]))
+            country_names.append(strings.intern(item["countryName"]))
+        return cls(
+            bytes(codes),
+            bytes(countries),
+            bytes(hq),
+            bank_names,
+            addresses,
+            country_names,
+            strings.build(),
+        )
+
+    def __len__(self):
+        return len(self.codes)
+
+    def code(self, i: int) -> str:
+        start = i * CODE_WIDTH
+        return str(self.codes.buffer[start : start + CODE_WIDTH], "ascii")
+
+    def country(self, i: int) -> str:
+        start = i * COUNTRY_WIDTH
+        return str(self.countries[start : start + COUNTRY_WIDTH], "ascii")
+
+    def is_headquarter(self, i: int) -> bool:
+        return bool(self.hq[i >> 3] & (1 << (i & 7)))
+
+    def row(self, i: int) -> dict:
+        # Same keys as SWIFT_CODE_FIELDS
+        return {
+            "address": self.strings.get(self.addresses[i]),
+            "bankName": self.strings.get(self.bank_names[i]),
+            "countryISO2": self.country(i),
+            "countryName": self.strings.get(self.country_names[i]),
+            "isHeadquarter": self.is_headquarter(i),
+            "swiftCode": self.code(i),
+        }
+
+    def lower_bound(self, key: bytes) -> int:
+        # First row whose code is not below key
+        block = bisect_right(self.block_index, key)
+        if block == 0:
+            return 0
+        start = (block - 1) * BLOCK_SIZE
+        end = min(start + BLOCK_SIZE, len(self.codes))
+        return bisect_left(self.codes, key, start, end)
+
+    def find(self, swift_code: str) -> int:
+        # Row number of the code, -1 when it is not stored
+        if not swift_code.isascii():
+            return -1
+        key = swift_code.encode("ascii")
+        i = self.lower_bound(key)
+        if i < len(self.codes) and self.codes[i] == key:
+            return i
+        return -1
+
+    def prefix_rows(self, prefix: str) -> Iterator[int]:
+        # Row numbers of the codes starting with prefix, in code order
+        if not prefix.isascii():
+            return
+        key = prefix.encode("ascii")
+        for i in range(self.lower_bound(key), len(self.codes)):
+            if not self.codes[i].startswith(key):
+                return
+            yield i
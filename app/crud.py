@@ -0,0 +1,498 @@
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, Mapping, NamedTuple, Optional, Sequence, Union
+
+from sqlalchemy import Connection, case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import config
+from app.model_orm import (
+    CountrySummaryORM,
+    DirectoryChangeORM,
+    DirectoryVersionORM,
+    SwiftCodeORM,
+)
+from app.models import (
+    BRANCH_FIELDS,
+    COUNTRY_SUMMARY_FIELDS,
+    PREFIX_FIELDS,
+    SWIFT_CODE_FIELDS,
+    Swift_Code,
+    Swift_with_Branches_country,
+    Switf_Branch,
+)
+from app.profiling import profile_span
+from app.search import dialect_name, index_codes, unindex_codes
+
+CODE_COLUMNS = [getattr(SwiftCodeORM, field) for field in SWIFT_CODE_FIELDS]
+BRANCH_COLUMNS = [getattr(SwiftCodeORM, field) for field in BRANCH_FIELDS]
+SUMMARY_COLUMNS = [
+    getattr(CountrySummaryORM, field) for field in COUNTRY_SUMMARY_FIELDS
+]
+# Codes per IN query when reading the rows of changed codes
+CHANGE_BATCH_SIZE = 500
+
+# Plain sync queries used by the routers. They take a sync Session so the same
+# code runs in a threadpool (sync mode) or through AsyncSession.run_sync (async mode)
+
+
+class DirectoryChange(NamedTuple):
+    # Directory version after a write and the countries whose codes it touched
+    epoch: str
+    version: int
+    countries: Optional[frozenset[str]]
+
+
+def get_directory_version(db: Session) -> tuple[str, int]:
+    row = db.get(DirectoryVersionORM, 1)
+    if row is None:
+        return "0", 0
+    return row.epoch, row.version
+
+
+def upsert_statement(dialect: str, model, values: dict, set_: dict):
+    # INSERT ... ON CONFLICT (primary key) DO UPDATE: one atomic statement, so
+    # two transactions writing a missing row at once cannot both insert it
+    statement = (postgresql if dialect == "postgresql" else sqlite).insert(model)
+    return statement.values(values).on_conflict_do_update(
+        index_elements=list(model.__table__.primary_key), set_=set_
+    )
+
+
+def bump_directory_version(
+    db: Union[Session, Connection],
+    countries: Optional[set[str]] = None,
+    upserted: Iterable[str] = (),
+    deleted: Iterable[str] = (),
+) -> DirectoryChange:
+    # Called before commit, so the new version is visible together with the data
+    # and the codes it changed. countries=None means any country may have
+    # changed (e.g. a full import).
+    db.execute(
+        upsert_statement(
+            dialect_name(db),
+            DirectoryVersionORM,
+            {"id": 1, "epoch": uuid.uuid4().hex, "version": 1},
+            {"version": DirectoryVersionORM.version + 1},
+        )
+    )
+    change = read_directory_change(db, countries)
+    changes = [
+        {"version": change.version, "swiftCode": code, "operation": operation}
+        for operation, codes in (("upsert", upserted), ("delete", deleted))
+        for code in codes
+    ]
+    if changes:
+        db.execute(insert(DirectoryChangeORM), changes)
+    db.execute(
+        delete(DirectoryChangeORM).where(
+            DirectoryChangeORM.version
+            <= change.version - config.DIRECTORY_CHANGE_RETENTION
+        )
+    )
+    return change
+
+
+def start_directory_epoch(db: Union[Session, Connection]) -> DirectoryChange:
+    # A full import: new epoch, workers reload their whole directory and the
+    # change log starts over
+    epoch = uuid.uuid4().hex
+    db.execute(
+        upsert_statement(
+            dialect_name(db),
+            DirectoryVersionORM,
+            {"id": 1, "epoch": epoch, "version": 1},
+            {"epoch": epoch, "version": DirectoryVersionORM.version + 1},
+        )
+    )
+    db.execute(delete(DirectoryChangeORM))
+    return read_directory_change(db, None)
+
+
+def read_directory_change(
+    db: Union[Session, Connection], countries: Optional[set[str]]
+) -> DirectoryChange:
+    row = db.execute(
+        select(DirectoryVersionORM.epoch, DirectoryVersionORM.version).where(
+            DirectoryVersionORM.id == 1
+        )
+    ).one()
+    return DirectoryChange(
+        row.epoch, row.version, frozenset(countries) if countries is not None else None
+    )
+
+
+def get_directory_changes(
+    db: Session, since: int, until: int
+) -> tuple[list[dict], list[str]]:
+    # Current rows of the codes written after version since up to until, and
+    # the codes deleted since. A code written again later is read as it is now.
+    last_operation = {}
+    rows = db.execute(
+        select(DirectoryChangeORM.swiftCode, DirectoryChangeORM.operation)
+        .where(DirectoryChangeORM.version > since, DirectoryChangeORM.version <= until)
+        .order_by(DirectoryChangeORM.version)
+    )
+    for swift_code, operation in rows:
+        last_operation[swift_code] = operation
+    upserted = [
+        code for code, operation in last_operation.items() if operation == "upsert"
+    ]
+
+    found = {}
+    for start in range(0, len(upserted), CHANGE_BATCH_SIZE):
+        batch = upserted[start : start + CHANGE_BATCH_SIZE]
+        rows = db.execute(
+            select(*CODE_COLUMNS).where(SwiftCodeORM.swiftCode.in_(batch))
+        )
+        found.update((row.swiftCode, row._asdict()) for row in rows)
+    # Without a consistent snapshot (READ COMMITTED) a code may already be gone
+    deleted = [code for code in last_operation if code not in found]
+    return list(found.values()), deleted
+
+
+def count_codes(counts: dict[str, list], rows: Iterable[Mapping], sign: int):
+    # Accumulates per country [codes, headquarters, countryName] changes for
+    # update_country_summary, sign is 1 for written rows and -1 for removed ones
+    for row in rows:
+        entry = counts.setdefault(row["countryISO2"], [0, 0, None])
+        entry[0] += sign
+        entry[1] += sign if row["isHeadquarter"] else 0
+        if sign > 0 and row.get("countryName") is not None:
+            entry[2] = row["countryName"]
+
+
+def update_country_summary(db: Union[Session, Connection], counts: dict[str, list]):
+    # Called before commit, like bump_directory_version. A country without a
+    # row is inserted with the counts, a row left at zero codes is deleted.
+    now = datetime.now(timezone.utc)
+    summary = CountrySummaryORM
+    dialect = dialect_name(db)
+    for countryISO2, (codes, headquarters, country_name) in counts.items():
+        values = {
+            "totalCodes": summary.totalCodes + codes,
+            "headquarters": summary.headquarters + headquarters,
+            "branches": summary.branches + codes - headquarters,
+            "lastModified": now,
+        }
+        if country_name is not None:
+            values["countryName"] = country_name
+        db.execute(
+            upsert_statement(
+                dialect,
+                summary,
+                {
+                    "countryISO2": countryISO2,
+                    "countryName": country_name,
+                    "totalCodes": codes,
+                    "headquarters": headquarters,
+                    "branches": codes - headquarters,
+                    "lastModified": now,
+                },
+                values,
+            )
+        )
+    db.execute(
+        delete(summary).where(
+            summary.countryISO2.in_(list(counts)), summary.totalCodes <= 0
+        )
+    )
+
+
+def rebuild_country_summary(db: Union[Session, Connection]):
+    # Full recount, used by the importer and for databases created before the
+    # summary table existed
+    headquarters = func.sum(case((SwiftCodeORM.isHeadquarter == True, 1), else_=0))
+    rows = db.execute(
+        select(
+            SwiftCodeORM.countryISO2,
+            func.min(SwiftCodeORM.countryName).label("countryName"),
+            func.count().label("totalCodes"),
+            headquarters.label("headquarters"),
+        ).group_by(SwiftCodeORM.countryISO2)
+    ).all()
+    now = datetime.now(timezone.utc)
+    db.execute(delete(CountrySummaryORM))
+    if rows:
+        db.execute(
+            insert(CountrySummaryORM),
+            [
+                {
+                    **row._asdict(),
+                    "branches": row.totalCodes - row.headquarters,
+                    "lastModified": now,
+                }
+                for row in rows
+            ],
+        )
+
+
+def ensure_country_summary(bind):
+    with bind.begin() as conn:
+        if conn.execute(select(CountrySummaryORM.countryISO2).limit(1)).first():
+            return
+        if conn.execute(select(SwiftCodeORM.swiftCode).limit(1)).first():
+            rebuild_country_summary(conn)
+
+
+def get_country_summary(db: Session, countryISO2: str) -> Optional[dict]:
+    row = db.execute(
+        select(*SUMMARY_COLUMNS).where(CountrySummaryORM.countryISO2 == countryISO2)
+    ).first()
+    return row._asdict() if row is not None else None
+
+
+def list_country_summaries(db: Session) -> list[dict]:
+    rows = db.execute(select(*SUMMARY_COLUMNS).order_by(CountrySummaryORM.countryISO2))
+    return [row._asdict() for row in rows]
+
+
+def get_swift_code(db: Session, swift_code: str) -> Optional[dict]:
+    # Plain dict shaped like Swift_Code / Swift_with_Branches, selected as
+    # columns so there is no ORM hydration and no model validation
+    with profile_span("hydrate"):
+        row = db.execute(
+            select(*CODE_COLUMNS).where(SwiftCodeORM.swiftCode == swift_code)
+        ).first()
+        if row is None:
+            return None
+        code = row._asdict()
+        if code["isHeadquarter"]:
+            branches = db.execute(
+                select(*BRANCH_COLUMNS).where(
+                    SwiftCodeORM.bankCode == swift_code[:8],
+                    SwiftCodeORM.isHeadquarter == False,
+                )
+            )
+            code["branches"] = [branch._asdict() for branch in branches]
+        return code
+
+
+def lookup_swift_codes(db: Session, swift_codes: list[str]) -> dict[str, dict]:
+    # One IN query for the codes and one for the branches of every HQ among them
+    rows = db.execute(
+        select(*CODE_COLUMNS).where(SwiftCodeORM.swiftCode.in_(set(swift_codes)))
+    )
+    found = {row.swiftCode: row._asdict() for row in rows}
+    hq_banks = {code[:8] for code, item in found.items() if item["isHeadquarter"]}
+
+    branches_by_bank = {}
+    if hq_banks:
+        branches = db.execute(
+            select(SwiftCodeORM.bankCode, *BRANCH_COLUMNS).where(
+                SwiftCodeORM.bankCode.in_(hq_banks),
+                SwiftCodeORM.isHeadquarter == False,
+            )
+        )
+        for branch in branches:
+            item = branch._asdict()
+            branches_by_bank.setdefault(item.pop("bankCode"), []).append(item)
+
+    for code, item in found.items():
+        if item["isHeadquarter"]:
+            item["branches"] = branches_by_bank.get(code[:8], [])
+    return found
+
+
+def get_codes_by_prefix(db: Session, partial: str, limit: int) -> list[dict]:
+    # Range scan on the primary key: partial <= swiftCode < next prefix
+    upper = partial[:-1] + chr(ord(partial[-1]) + 1)
+    rows = db.execute(
+        select(*(getattr(SwiftCodeORM, field) for field in PREFIX_FIELDS))
+        .where(SwiftCodeORM.swiftCode >= partial, SwiftCodeORM.swiftCode < upper)
+        .order_by(SwiftCodeORM.swiftCode)
+        .limit(limit)
+    )
+    return [row._asdict() for row in rows]
+
+
+def get_country(db: Session, countryISO2: str) -> Optional[Swift_with_Branches_country]:
+    with profile_span("hydrate"):
+        codes = db.query(SwiftCodeORM).filter_by(countryISO2=countryISO2).all()
+    if not codes:
+        return None
+
+    with profile_span("validate"):
+        country_name = codes[0].countryName
+        branches_data = []
+        for item in codes:
+            branches_data.append(Switf_Branch(**item.__dict__))
+        return Swift_with_Branches_country(
+            countryISO2=countryISO2, countryName=country_name, swiftCodes=branches_data
+        )
+
+
+def get_country_page(
+    db: Session,
+    countryISO2: str,
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    fields: Sequence[str] = BRANCH_FIELDS,
+) -> Optional[dict]:
+    # Keyset pagination on swiftCode, selecting only the requested columns
+    country = (
+        db.query(SwiftCodeORM.countryName).filter_by(countryISO2=countryISO2).first()
+    )
+    if country is None:
+        return None
+
+    columns = [getattr(SwiftCodeORM, field) for field in fields]
+    query = db.query(*columns).filter(SwiftCodeORM.countryISO2 == countryISO2)
+    if after is not None:
+        query = query.filter(SwiftCodeORM.swiftCode > after)
+    query = query.order_by(SwiftCodeORM.swiftCode)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    with profile_span("hydrate"):
+        rows = query.all()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].swiftCode
+    return {
+        "countryISO2": countryISO2,
+        "countryName": country.countryName,
+        "swiftCodes": [row._asdict() for row in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+def add_swift(db: Session, body: Swift_Code) -> Optional[DirectoryChange]:
+    exists = db.query(SwiftCodeORM).filter_by(swiftCode=body.swiftCode).first()
+    if exists:
+        return None
+
+    new_item = SwiftCodeORM(**body.model_dump(), bankCode=body.swiftCode[:8])
+    db.add(new_item)
+    index_codes(db, [body.model_dump()])
+    counts = {}
+    count_codes(counts, [body.model_dump()], 1)
+    update_country_summary(db, counts)
+    change = bump_directory_version(
+        db, {body.countryISO2}, upserted=[body.swiftCode]
+    )
+    db.commit()
+    return change
+
+
+def delete_swift_code(db: Session, swift_code: str) -> Optional[DirectoryChange]:
+    exists = db.query(SwiftCodeORM).filter_by(swiftCode=swift_code).first()
+    if not exists:
+        return None
+    db.delete(exists)
+    unindex_codes(db, [swift_code])
+    counts = {}
+    count_codes(
+        counts,
+        [{"countryISO2": exists.countryISO2, "isHeadquarter": exists.isHeadquarter}],
+        -1,
+    )
+    update_country_summary(db, counts)
+    change = bump_directory_version(db, {exists.countryISO2}, deleted=[swift_code])
+    db.commit()
+    return change
+
+
+def existing_codes(db: Session, swift_codes: list[str]) -> dict[str, dict]:
+    # swiftCode -> countryISO2 and isHeadquarter of the codes already stored
+    rows = db.execute(
+        select(
+            SwiftCodeORM.swiftCode, SwiftCodeORM.countryISO2, SwiftCodeORM.isHeadquarter
+        ).where(SwiftCodeORM.swiftCode.in_(set(swift_codes)))
+    )
+    return {
+        row.swiftCode: {
+            "countryISO2": row.countryISO2,
+            "isHeadquarter": row.isHeadquarter,
+        }
+        for row in rows
+    }
+
+
+def bulk_add_swift(
+    db: Session, items: list[Swift_Code], on_conflict: str
+) -> tuple[list[tuple[str, str]], list[str], Optional[DirectoryChange]]:
+    # Returns (code, status) per item, the conflicting codes and the change. With
+    # on_conflict="fail" nothing is written when there are conflicts. Codes
+    # inserted by another request between the existence check and the INSERT
+    # fail the transaction; it is rolled back and the batch checked once more,
+    # so they are reported as conflicts (or skipped / updated).
+    try:
+        return write_bulk(db, items, on_conflict)
+    except IntegrityError:
+        db.rollback()
+        return write_bulk(db, items, on_conflict)
+
+
+def write_bulk(
+    db: Session, items: list[Swift_Code], on_conflict: str
+) -> tuple[list[tuple[str, str]], list[str], Optional[DirectoryChange]]:
+    # Codes are unique within a batch (Swift_bulk_create)
+    existing = existing_codes(db, [item.swiftCode for item in items])
+
+    results = []
+    conflicts = []
+    new_rows = {}
+    updated_rows = {}
+    for item in items:
+        code = item.swiftCode
+        row = {**item.model_dump(), "bankCode": code[:8]}
+        if code not in existing:
+            new_rows[code] = row
+            results.append((code, "created"))
+        elif on_conflict == "fail":
+            conflicts.append(code)
+        elif on_conflict == "skip":
+            results.append((code, "skipped"))
+        else:
+            updated_rows[code] = row
+            results.append((code, "updated"))
+
+    if conflicts or not (new_rows or updated_rows):
+        return results, conflicts, None
+
+    # One transaction, one executemany per statement
+    if new_rows:
+        db.execute(insert(SwiftCodeORM), list(new_rows.values()))
+    if updated_rows:
+        db.execute(update(SwiftCodeORM), list(updated_rows.values()))
+        unindex_codes(db, updated_rows)
+    index_codes(db, [*new_rows.values(), *updated_rows.values()])
+    # An upsert can move a code to another country, so both countries change
+    counts = {}
+    count_codes(counts, (existing[code] for code in updated_rows), -1)
+    count_codes(counts, [*new_rows.values(), *updated_rows.values()], 1)
+    update_country_summary(db, counts)
+    change = bump_directory_version(
+        db, set(counts), upserted=[*new_rows, *updated_rows]
+    )
+    db.commit()
+    return results, conflicts, change
+
+
+def bulk_delete_swift_codes(
+    db: Session, swift_codes: list[str]
+) -> tuple[list[tuple[str, str]], Optional[DirectoryChange]]:
+    existing = existing_codes(db, swift_codes)
+    change = None
+    if existing:
+        db.execute(delete(SwiftCodeORM).where(SwiftCodeORM.swiftCode.in_(existing)))
+        unindex_codes(db, existing)
+        counts = {}
+        count_codes(counts, existing.values(), -1)
+        update_country_summary(db, counts)
+        change = bump_directory_version(db, set(counts), deleted=existing)
+        db.commit()
+
+    results = []
+    deleted = set()
+    for code in swift_codes:
+        if code in existing and code not in deleted:
+            deleted.add(code)
+            results.append((code, "deleted"))
+        else:
+            results.append((code, "not_found"))
+    return results, change
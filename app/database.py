@@ -1,17 +1,186 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import time
+from typing import Union
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import os
 
+from app import config
+from app.metrics import pool_checkout
+from app.profiling import record
+
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 db_path = os.path.join(BASE_DIR, "swift.db")
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{db_path}"
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL or f"sqlite:///{db_path}"
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long each checkout waited for a connection
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            seconds = time.perf_counter() - start
+            pool_checkout.observe(seconds)
+            record("session", seconds)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            seconds = time.perf_counter() - start
+            pool_checkout.observe(seconds)
+            record("session", seconds)
+
+
+def to_async_url(url: Union[str, URL]) -> URL:
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def engine_options(url: Union[str, URL], is_async: bool = False) -> dict:
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            return {}
+        options = {"poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool}
+        if not is_async:
+            options["connect_args"] = {"check_same_thread": False}
+        return options
+
+    return {
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+    }
+
+
+def is_sqlite_file(url: Union[str, URL]) -> bool:
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def read_only_url(url: Union[str, URL]) -> URL:
+    # sqlite:///path -> sqlite:///file:path?mode=ro&uri=true
+    url = make_url(url)
+    return url.set(
+        database=f"file:{url.database}",
+        query={**url.query, "mode": "ro", "uri": "true"},
+    )
+
 
+def apply_sqlite_pragmas(sync_engine):
+    read_only = sync_engine.url.query.get("mode") == "ro"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers run while add/delete commit; it is stored in the
+        # file, so only writer connections need to switch it on
+        if not read_only:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size={config.SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+        cursor.close()
+
+
+def create_database_engine(url: Union[str, URL]):
+    engine = create_engine(url, **engine_options(url))
+    if is_sqlite_file(url):
+        apply_sqlite_pragmas(engine)
+    return engine
+
+
+def create_async_database_engine(url: Union[str, URL]):
+    url = to_async_url(url)
+    engine = create_async_engine(url, **engine_options(url, is_async=True))
+    if is_sqlite_file(url):
+        apply_sqlite_pragmas(engine.sync_engine)
+    return engine
+
+
+engine = create_database_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Reads go through a read-only engine on SQLite files, so they never take the
+# write lock. Other backends read through the main engine.
+read_engine = engine
+if config.SQLITE_READ_ONLY_ENGINE and is_sqlite_file(SQLALCHEMY_DATABASE_URL):
+    read_engine = create_database_engine(read_only_url(SQLALCHEMY_DATABASE_URL))
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Async engine is only created in async mode, so aiosqlite/asyncpg stay optional
+async_engine = None
+async_read_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+if config.ASYNC_DB:
+    async_engine = create_async_database_engine(SQLALCHEMY_DATABASE_URL)
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+    async_read_engine = async_engine
+    if read_engine is not engine:
+        async_read_engine = create_async_database_engine(read_engine.url)
+    AsyncReadSessionLocal = async_sessionmaker(
+        async_read_engine, autoflush=False, expire_on_commit=False
+    )
+
 Base = declarative_base()
+
+DBSession = Union[Session, AsyncSession]
+
+
+async def get_db():
+    if config.ASYNC_DB:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+
+async def get_read_db():
+    if config.ASYNC_DB:
+        async with AsyncReadSessionLocal() as db:
+            yield db
+    else:
+        db = ReadSessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+
+async def run_db(db: DBSession, fn, *args):
+    # Run a sync query function from app.crud with either kind of session
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
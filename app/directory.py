@@ -0,0 +1,242 @@
+import heapq
+from bisect import bisect_left, insort
+from typing import Iterable, Iterator, Optional, Union
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.columnar import ColumnarStore, fits
+from app.crud import get_directory_version
+from app.model_orm import SwiftCodeORM
+from app.models import BRANCH_FIELDS, PREFIX_FIELDS, SWIFT_CODE_FIELDS
+from app.snapshot_file import read_snapshot, write_snapshot
+
+# Writes of up to this many codes update the sorted overlay list in place,
+# larger batches merge into a new list
+INSORT_BATCH_LIMIT = 64
+LOAD_BATCH_SIZE = 10_000
+
+
+def code_order(db: Session):
+    # The store is searched with byte-wise comparisons, PostgreSQL would sort
+    # by the database locale unless told otherwise
+    if db.get_bind().dialect.name == "postgresql":
+        return SwiftCodeORM.swiftCode.collate("C")
+    return SwiftCodeORM.swiftCode
+
+
+class SwiftDirectory:
+    # In-memory copy of swift_codes. The bulk of it is a read-only
+    # ColumnarStore sorted by code; writes made after loading go to a small
+    # overlay of plain dicts, and the store rows they replace or delete are
+    # shadowed. Branches of a bank and prefix matches are contiguous runs of
+    # the sorted codes, so no other index is needed.
+    # version is the (epoch, version) of directory_version the copy holds.
+
+    def __init__(self):
+        self.loaded = False
+        self.version: Optional[tuple[str, int]] = None
+        self._store = ColumnarStore.build([])
+        self._overlay: dict[str, dict] = {}
+        self._overlay_sorted: list[str] = []
+        self._shadowed: set[str] = set()
+        self._count = 0
+
+    def load(self, db: Session):
+        # Read in the same transaction as the rows
+        version = get_directory_version(db)
+        overlay = {}
+        columns = [getattr(SwiftCodeORM, field) for field in SWIFT_CODE_FIELDS]
+
+        def store_rows():
+            rows = db.execute(
+                select(*columns)
+                .order_by(code_order(db))
+                .execution_options(yield_per=LOAD_BATCH_SIZE)
+            )
+            for row in rows:
+                item = row._asdict()
+                if fits(item):
+                    yield item
+                else:
+                    overlay[item["swiftCode"]] = item
+
+        store = ColumnarStore.build(store_rows())
+        self.use(store, overlay, version)
+
+    def load_file(self, path: str, epoch: str, version: int) -> bool:
+        # Maps the snapshot file if it holds this directory version
+        snapshot = read_snapshot(path) if path else None
+        if snapshot is None or (snapshot.epoch, snapshot.version) != (epoch, version):
+            return False
+        self.use(snapshot.store, snapshot.overlay, (epoch, version))
+        return True
+
+    def save(self, path: str):
+        # Only right after a load, later writes are not part of the version
+        write_snapshot(path, self._store, self._overlay, *self.version)
+
+    def use(
+        self,
+        store: ColumnarStore,
+        overlay: Optional[dict[str, dict]] = None,
+        version: Optional[tuple[str, int]] = None,
+    ):
+        overlay = overlay or {}
+        # Swap whole objects so concurrent readers never see a half built snapshot
+        self._store = store
+        self._overlay = overlay
+        self._overlay_sorted = sorted(overlay)
+        self._shadowed = set()
+        self._count = len(store) + len(overlay)
+        self.version = version
+        self.loaded = True
+
+    def adopt(self, other: "SwiftDirectory"):
+        # Takes over a copy loaded elsewhere (background reload)
+        self.use(other._store, other._overlay, other.version)
+
+    def apply_changes(
+        self, rows: list[dict], deleted: list[str], version: tuple[str, int]
+    ):
+        # Catches up with writes made by other processes (crud.get_directory_changes).
+        # The version is the one the rows were read at, even if this process
+        # moved past it meanwhile: a lower version only means another catch-up.
+        self.add_many(rows)
+        self.remove_many(deleted)
+        self.version = version
+
+    def record_change(self, epoch: str, version: int):
+        # Writes made by this process are applied in place by the handlers, so
+        # the copy moves to their version if it held the one just before it.
+        # Otherwise another process wrote in between and the copy stays stale.
+        # ("0", 0) is a database without a version row yet, the first write
+        # creates it at version 1 with a new epoch
+        if self.version in ((epoch, version - 1), ("0", version - 1)):
+            self.version = (epoch, version)
+
+    def clear(self):
+        self.version = None
+        self._store = ColumnarStore.build([])
+        self._overlay = {}
+        self._overlay_sorted = []
+        self._shadowed = set()
+        self._count = 0
+        self.loaded = False
+
+    def __len__(self):
+        return self._count
+
+    def _find(self, swift_code: str) -> int:
+        if swift_code in self._shadowed:
+            return -1
+        return self._store.find(swift_code)
+
+    def __contains__(self, swift_code: str) -> bool:
+        return swift_code in self._overlay or self._find(swift_code) >= 0
+
+    def get(self, swift_code: str) -> Optional[dict]:
+        item = self._overlay.get(swift_code)
+        if item is not None:
+            return item
+        i = self._find(swift_code)
+        return self._store.row(i) if i >= 0 else None
+
+    def _run(self, prefix: str) -> Iterator[tuple[str, Union[int, dict]]]:
+        # (code, store row number or overlay dict) of every code starting with
+        # prefix, in code order
+        store = self._store
+        stored = (
+            (code, i)
+            for code, i in ((store.code(i), i) for i in store.prefix_rows(prefix))
+            if code not in self._shadowed
+        )
+        overlay_codes = self._overlay_sorted
+        added = []
+        for j in range(bisect_left(overlay_codes, prefix), len(overlay_codes)):
+            if not overlay_codes[j].startswith(prefix):
+                break
+            added.append((overlay_codes[j], self._overlay[overlay_codes[j]]))
+        if not added:
+            return stored
+        return heapq.merge(stored, added, key=lambda entry: entry[0])
+
+    def _row(self, entry: Union[int, dict]) -> dict:
+        return entry if isinstance(entry, dict) else self._store.row(entry)
+
+    def _is_headquarter(self, entry: Union[int, dict]) -> bool:
+        if isinstance(entry, dict):
+            return entry["isHeadquarter"]
+        return self._store.is_headquarter(entry)
+
+    def branches(self, bank_code: str) -> list[dict]:
+        # Only the fields of a branch in the HQ response
+        branches = []
+        for _, entry in self._run(bank_code):
+            if not self._is_headquarter(entry):
+                item = self._row(entry)
+                branches.append({field: item[field] for field in BRANCH_FIELDS})
+        return branches
+
+    def response(self, swift_code: str) -> Optional[dict]:
+        # Same payload as crud.get_swift_code
+        item = self.get(swift_code)
+        if item is None or not item["isHeadquarter"]:
+            return item
+        return {**item, "branches": self.branches(swift_code[:8])}
+
+    def prefix(self, partial: str, limit: int) -> list[dict]:
+        matches = []
+        for _, entry in self._run(partial):
+            if len(matches) == limit:
+                break
+            item = self._row(entry)
+            matches.append({field: item[field] for field in PREFIX_FIELDS})
+        return matches
+
+    def add(self, item: dict):
+        self.add_many([item])
+
+    def remove(self, swift_code: str):
+        self.remove_many([swift_code])
+
+    def add_many(self, items: Iterable[dict]):
+        # Adds or replaces codes
+        new_codes = []
+        for item in items:
+            swift_code = item["swiftCode"]
+            if swift_code not in self:
+                self._count += 1
+            if swift_code not in self._overlay:
+                new_codes.append(swift_code)
+            self._overlay[swift_code] = item
+            if self._store.find(swift_code) >= 0:
+                self._shadowed.add(swift_code)
+        if len(new_codes) <= INSORT_BATCH_LIMIT:
+            for swift_code in new_codes:
+                insort(self._overlay_sorted, swift_code)
+        else:
+            self._overlay_sorted = list(
+                heapq.merge(self._overlay_sorted, sorted(new_codes))
+            )
+
+    def remove_many(self, swift_codes: Iterable[str]):
+        removed = set()
+        for swift_code in swift_codes:
+            if swift_code not in self:
+                continue
+            self._count -= 1
+            if self._overlay.pop(swift_code, None) is not None:
+                removed.add(swift_code)
+            if self._store.find(swift_code) >= 0:
+                self._shadowed.add(swift_code)
+        if len(removed) <= INSORT_BATCH_LIMIT:
+            for swift_code in removed:
+                del self._overlay_sorted[bisect_left(self._overlay_sorted, swift_code)]
+        else:
+            self._overlay_sorted = [
+                code for code in self._overlay_sorted if code not in removed
+            ]
+
+
+directory = SwiftDirectory()
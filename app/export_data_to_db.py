@@ -1,23 +1,47 @@
-import pandas as pd
-from database import engine
+import argparse
+import hashlib
 import os
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Iterator, Optional
 
+import pandas as pd
+from sqlalchemy import MetaData, Table, delete, insert, inspect, select
+from sqlalchemy.orm import Session
 
-if not os.path.exists("app/data/Interns_2025_SWIFT_CODES - Sheet1.csv"):
-    raise FileNotFoundError("CSV file not found in ./data/")
-
-data = pd.read_csv("app/data/Interns_2025_SWIFT_CODES - Sheet1.csv")
-data = data.rename(
-    columns={
-        "SWIFT CODE": "swiftCode",
-        "NAME": "bankName",
-        "ADDRESS": "address",
-        "COUNTRY ISO2 CODE": "countryISO2",
-        "COUNTRY NAME": "countryName",
-    }
+from app import config
+from app.crud import (
+    get_directory_version,
+    rebuild_country_summary,
+    start_directory_epoch,
 )
+from app.database import Base, engine
+from app.directory import SwiftDirectory
+from app.model_orm import (
+    SEARCH_TABLE,
+    ImportMetadataORM,
+    SwiftCodeORM,
+    create_search_index,
+    fill_search_table,
+    missing_indexes,
+)
+from app.snapshot_file import read_snapshot
+
+CSV_PATH = config.SWIFT_CSV_PATH
+STAGING_TABLE = "swift_codes_staging"
+STAGING_SEARCH_TABLE = "swift_codes_fts_staging"
+DEFAULT_CHUNK_SIZE = 10_000
 
-data["isHeadquarter"] = data["swiftCode"].str.endswith("XXX")
+CSV_COLUMNS = {
+    "SWIFT CODE": "swiftCode",
+    "NAME": "bankName",
+    "ADDRESS": "address",
+    "COUNTRY ISO2 CODE": "countryISO2",
+    "COUNTRY NAME": "countryName",
+}
 
 needed_columns = [
     "countryISO2",
@@ -26,9 +50,239 @@ needed_columns = [
     "address",
     "countryName",
     "isHeadquarter",
+    "bankCode",
 ]
 
-relevant_data = data[needed_columns]
-relevant_data
 
-relevant_data.to_sql("swift_codes", con=engine, if_exists="replace", index=False)
+def normalise_chunk(chunk: pd.DataFrame) -> list[dict]:
+    chunk = chunk.rename(columns=CSV_COLUMNS)
+    # Same normalisation as the Swift_Code model applies on POST
+    for column in ("swiftCode", "countryISO2", "countryName"):
+        chunk[column] = chunk[column].str.strip().str.upper()
+
+    chunk["isHeadquarter"] = chunk["swiftCode"].str.endswith("XXX")
+    chunk["bankCode"] = chunk["swiftCode"].str[:8]
+
+    relevant_data = chunk[needed_columns]
+    # NaN -> None so empty CSV cells are stored as NULL
+    return relevant_data.astype(object).where(relevant_data.notna(), None).to_dict(
+        "records"
+    )
+
+
+def read_swift_csv(
+    path: str, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[list[dict]]:
+    chunks = pd.read_csv(
+        path,
+        usecols=list(CSV_COLUMNS),
+        dtype=str,
+        chunksize=chunk_size,
+        # Only empty cells are missing values, "NA" is Namibia
+        keep_default_na=False,
+        na_values=[""],
+    )
+    for chunk in chunks:
+        yield normalise_chunk(chunk)
+
+
+def csv_fingerprint(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return f"{os.path.getsize(path)}:{digest.hexdigest()}"
+
+
+def stored_fingerprint(bind=engine) -> Optional[str]:
+    if not inspect(bind).has_table(ImportMetadataORM.__tablename__):
+        return None
+    with bind.connect() as conn:
+        return conn.execute(
+            select(ImportMetadataORM.fingerprint).where(ImportMetadataORM.id == 1)
+        ).scalar()
+
+
+def has_data(bind=engine) -> bool:
+    # A swift_codes table from an older schema (e.g. written by pandas, without
+    # bankCode) cannot be served, so it counts as empty and gets imported again
+    # in the foreground at startup
+    if missing_indexes(bind):
+        return False
+    with bind.connect() as conn:
+        return conn.execute(select(SwiftCodeORM.swiftCode).limit(1)).first() is not None
+
+
+def staging_table() -> Table:
+    # Same columns and primary key as swift_codes, but no secondary indexes
+    # while loading; they are built once after the swap
+    columns = []
+    for column in SwiftCodeORM.__table__.columns:
+        column = column._copy()
+        column.index = None
+        columns.append(column)
+    return Table(STAGING_TABLE, MetaData(), *columns)
+
+
+def import_csv(
+    path: str,
+    bind=engine,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    fingerprint: Optional[str] = None,
+) -> int:
+    # Rows are loaded into a staging table, one chunk in memory and one
+    # executemany INSERT per transaction at a time, while the API keeps
+    # reading the current swift_codes. One final transaction then swaps the
+    # tables, so readers see either the old or the new directory.
+    Base.metadata.create_all(bind=bind)
+    fingerprint = fingerprint or csv_fingerprint(path)
+    staging = staging_table()
+    staging.drop(bind, checkfirst=True)
+    staging.create(bind)
+
+    rows = 0
+    for records in read_swift_csv(path, chunk_size):
+        with bind.begin() as conn:
+            conn.execute(insert(staging), records)
+        rows += len(records)
+
+    # SQLite's FTS table is rebuilt next to the staging table as well
+    is_sqlite = bind.dialect.name == "sqlite"
+    if is_sqlite:
+        with bind.begin() as conn:
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {STAGING_SEARCH_TABLE}")
+            create_search_index(conn, STAGING_SEARCH_TABLE)
+            fill_search_table(conn, STAGING_SEARCH_TABLE, STAGING_TABLE)
+
+    with bind.begin() as conn:
+        # pysqlite only opens a transaction before DML, so the DDL below is
+        # only atomic because these writes come first
+        conn.execute(delete(ImportMetadataORM))
+        conn.execute(
+            insert(ImportMetadataORM).values(
+                id=1,
+                source=os.path.basename(path),
+                fingerprint=fingerprint,
+                rows=rows,
+                imported_at=datetime.now(timezone.utc),
+            )
+        )
+        start_directory_epoch(conn)
+        SwiftCodeORM.__table__.drop(conn)
+        conn.exec_driver_sql(
+            f"ALTER TABLE {STAGING_TABLE} RENAME TO {SwiftCodeORM.__tablename__}"
+        )
+        if is_sqlite:
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+            conn.exec_driver_sql(
+                f"ALTER TABLE {STAGING_SEARCH_TABLE} RENAME TO {SEARCH_TABLE}"
+            )
+        for index in SwiftCodeORM.__table__.indexes:
+            index.create(conn)
+        create_search_index(conn)
+        rebuild_country_summary(conn)
+    return rows
+
+
+def import_if_changed(
+    path: str,
+    bind=engine,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    force: bool = False,
+) -> Optional[int]:
+    # Returns the number of imported rows, None when the file was already loaded
+    fingerprint = csv_fingerprint(path)
+    if not force and has_data(bind) and stored_fingerprint(bind) == fingerprint:
+        return None
+    return import_csv(path, bind, chunk_size, fingerprint)
+
+
+def build_snapshot(path: str = config.SNAPSHOT_PATH, bind=engine) -> int:
+    # Memory-mapped copy of the directory the API workers start from
+    snapshot = SwiftDirectory()
+    with Session(bind) as db:
+        snapshot.load(db)
+    snapshot.save(path)
+    return len(snapshot)
+
+
+def refresh_snapshot(path: str = config.SNAPSHOT_PATH, bind=engine) -> Optional[int]:
+    # Rebuilds the file when its header is not the current directory version,
+    # e.g. after writes through the API. None when it was already current.
+    if not path:
+        return None
+    snapshot = read_snapshot(path)
+    with Session(bind) as db:
+        current = get_directory_version(db)
+    if snapshot is not None and (snapshot.epoch, snapshot.version) == current:
+        return None
+    return build_snapshot(path, bind)
+
+
+def import_in_background(path: str) -> subprocess.Popen:
+    # Used at server start when there is already data to serve: the import
+    # runs in its own process and sends SIGHUP once the new data is swapped in
+    return subprocess.Popen([sys.executable, "-m", "app.export_data_to_db", path])
+
+
+def reload_server(pidfile: str = config.SERVER_PIDFILE) -> bool:
+    # Ask a running gunicorn master to load the new data and replace its workers
+    try:
+        with open(pidfile) as file:
+            pid = int(file.read().strip())
+        os.kill(pid, signal.SIGHUP)
+    except (FileNotFoundError, ValueError, ProcessLookupError):
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load SWIFT codes from CSV")
+    parser.add_argument("csv_path", nargs="?", default=CSV_PATH)
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="rows read and inserted per batch",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="import even if this file was already loaded",
+    )
+    parser.add_argument(
+        "--no-reload",
+        action="store_true",
+        help="do not send SIGHUP to a running gunicorn master",
+    )
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csv_path):
+        raise FileNotFoundError(f"CSV file not found: {args.csv_path}")
+
+    start = time.perf_counter()
+    rows = import_if_changed(
+        args.csv_path, chunk_size=args.chunk_size, force=args.force
+    )
+    elapsed = time.perf_counter() - start
+    if rows is None:
+        print(f"{args.csv_path} is unchanged since the last import, skipped")
+    else:
+        print(
+            f"Loaded {rows} SWIFT codes in {elapsed:.2f}s "
+            f"({rows / elapsed if elapsed else 0:.0f} rows/s)"
+        )
+    # Also when the CSV was unchanged: writes through the API leave the file
+    # behind the database
+    start = time.perf_counter()
+    if refresh_snapshot() is not None:
+        print(
+            f"Wrote snapshot {config.SNAPSHOT_PATH} "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+    if rows is not None and not args.no_reload and reload_server():
+        print("Sent SIGHUP to the API server to reload the data")
+
+
+if __name__ == "__main__":
+    main()
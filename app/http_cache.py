@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app import config, crud
+from app.database import DBSession, SessionLocal, run_db
+from app.directory import SwiftDirectory, directory
+from app.model_orm import SwiftCodeORM
+from app.profiling import profile_span
+
+
+def make_etag(epoch: str, version: int) -> str:
+    return f'"{epoch}-{version}"'
+
+
+class DirectoryVersion:
+    # Per-process copy of the directory_version row, so conditional requests can
+    # be answered without a query while it is fresh
+
+    def __init__(self):
+        self.etag: Optional[str] = None
+        self.checked_at = 0.0
+
+    def is_fresh(self) -> bool:
+        return (
+            self.etag is not None
+            and time.monotonic() - self.checked_at < config.DIRECTORY_VERSION_TTL
+        )
+
+    def set(self, epoch: str, version: int):
+        self.etag = make_etag(epoch, version)
+        self.checked_at = time.monotonic()
+
+    def invalidate(self):
+        self.etag = None
+
+
+directory_version = DirectoryVersion()
+
+
+class CountryResponseCache:
+    # Serialised JSON of GET /swift-codes/country/{code} per country, LRU bounded.
+    # Entries are valid for directory version self.etag. Writes made by this
+    # process only drop the countries they touched; any other version change
+    # (another worker, an import) drops everything.
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.etag: Optional[str] = None
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_version(self, etag: str):
+        if etag != self.etag:
+            self._entries.clear()
+            self.etag = etag
+
+    def get(self, countryISO2: str, etag: str) -> Optional[bytes]:
+        with self._lock:
+            self._check_version(etag)
+            body = self._entries.get(countryISO2)
+            if body is not None:
+                self._entries.move_to_end(countryISO2)
+            return body
+
+    def put(self, countryISO2: str, etag: str, body: bytes):
+        with self._lock:
+            self._check_version(etag)
+            self._entries[countryISO2] = body
+            self._entries.move_to_end(countryISO2)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def apply_change(self, change: crud.DirectoryChange):
+        previous = make_etag(change.epoch, change.version - 1)
+        with self._lock:
+            if self.etag == previous and change.countries is not None:
+                for countryISO2 in change.countries:
+                    self._entries.pop(countryISO2, None)
+            else:
+                self._entries.clear()
+            self.etag = make_etag(change.epoch, change.version)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.etag = None
+
+    def __contains__(self, countryISO2: str) -> bool:
+        return countryISO2 in self._entries
+
+
+country_cache = CountryResponseCache(config.COUNTRY_CACHE_SIZE)
+
+
+def record_change(change: Optional[crud.DirectoryChange]):
+    # Called by write handlers after commit
+    if change is None:
+        return
+    country_cache.apply_change(change)
+    directory_version.set(change.epoch, change.version)
+    directory.record_change(change.epoch, change.version)
+
+
+def serialise_country(country) -> bytes:
+    with profile_span("encode"):
+        return country.model_dump_json().encode()
+
+
+def warm_country_cache(db: Session):
+    epoch, version = crud.get_directory_version(db)
+    etag = make_etag(epoch, version)
+    countries = db.scalars(
+        select(SwiftCodeORM.countryISO2)
+        .group_by(SwiftCodeORM.countryISO2)
+        .order_by(func.count().desc())
+        .limit(country_cache.maxsize)
+    ).all()
+    # Least popular first, so the biggest countries end up most recently used
+    for countryISO2 in reversed(countries):
+        country = crud.get_country(db, countryISO2)
+        if country is not None:
+            country_cache.put(countryISO2, etag, serialise_country(country))
+
+
+async def current_etag(db: DBSession) -> str:
+    if not directory_version.is_fresh():
+        epoch, version = await run_db(db, crud.get_directory_version)
+        directory_version.set(epoch, version)
+    return directory_version.etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def cache_headers(etag: str) -> dict:
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={config.HTTP_CACHE_MAX_AGE}",
+    }
+
+
+async def not_modified(
+    request: Request, response: Response, db: DBSession
+) -> Optional[Response]:
+    # Sets ETag/Cache-Control on the response, returns a 304 when the client
+    # already has this version
+    with profile_span("etag"):
+        etag = await current_etag(db)
+    headers = cache_headers(etag)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+update_task: Optional[asyncio.Task] = None
+
+
+def read_directory_update(held: tuple[str, int]):
+    # Returns a whole new copy after an import (new epoch) or when the change
+    # log no longer reaches back to the held version, otherwise the changed
+    # rows, the deleted codes and the version they were read at
+    with SessionLocal() as db:
+        epoch, version = crud.get_directory_version(db)
+        held_epoch, held_version = held
+        # ("0", 0): the database had no version row yet when the copy was loaded
+        if held == ("0", 0):
+            held_epoch = epoch
+        if (
+            epoch != held_epoch
+            or version - held_version >= config.DIRECTORY_CHANGE_RETENTION
+        ):
+            fresh = SwiftDirectory()
+            if not fresh.load_file(config.SNAPSHOT_PATH, epoch, version):
+                fresh.load(db)
+            return fresh, None
+        rows, deleted = crud.get_directory_changes(db, held_version, version)
+        return None, (rows, deleted, (epoch, version))
+
+
+async def update_directory():
+    # The database is read in the threadpool and the result applied on the
+    # event loop, so requests keep using the old copy (or the database)
+    # meanwhile. Applying only the changed codes leaves the store inherited
+    # from the master or mapped from the snapshot file in place.
+    fresh, changes = await run_in_threadpool(read_directory_update, directory.version)
+    if fresh is not None:
+        directory.adopt(fresh)
+    else:
+        directory.apply_changes(*changes)
+
+
+def start_directory_update():
+    # At most one update per process at a time
+    global update_task
+    if update_task is None or update_task.done():
+        update_task = asyncio.get_running_loop().create_task(update_directory())
+
+
+async def directory_is_current(db: DBSession) -> bool:
+    # The in-memory directory only answers while it holds the version the
+    # ETags name. Writes made by another worker (or an import) make it stale:
+    # requests go to the database until an update has caught up.
+    if not (config.USE_MEMORY_SNAPSHOT and directory.loaded):
+        return False
+    etag = await current_etag(db)
+    if directory.version is not None and make_etag(*directory.version) == etag:
+        return True
+    start_directory_update()
+    return False
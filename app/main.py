@@ -1,19 +1,95 @@
-from fastapi import FastAPI
-from app.routers import swift
-from app.database import Base, engine
+from contextlib import asynccontextmanager
 
+from fastapi import FastAPI, Response
+from app import config, crud
+from app.routers import countries, swift
+from app import database
+from app.database import Base, SessionLocal, engine
+from app.directory import directory
+from app.http_cache import country_cache, directory_version, warm_country_cache
+from app import metrics
+from app.model_orm import ensure_search_index, missing_indexes
+from app.profiling import ProfilingMiddleware
+from app.serialization import DefaultJSONResponse
 
-app = FastAPI()
+
+def warm_up():
+    # Loads the snapshot and caches. Under gunicorn this already ran in the
+    # master before forking, so workers skip what they inherited.
+    Base.metadata.create_all(bind=engine)
+    missing = missing_indexes(engine)
+    if missing:
+        raise RuntimeError(
+            f"swift_codes table is missing indexes on {missing}, "
+            "reload it with app/export_data_to_db.py"
+        )
+    ensure_search_index(engine)
+    crud.ensure_country_summary(engine)
+    if config.USE_MEMORY_SNAPSHOT and not directory.loaded:
+        with SessionLocal() as db:
+            epoch, version = crud.get_directory_version(db)
+            # A file left stale by later writes is not rewritten here: only the
+            # importer writes it, workers may share a read-only volume
+            if not directory.load_file(config.SNAPSHOT_PATH, epoch, version):
+                directory.load(db)
+    if config.COUNTRY_CACHE_WARM and country_cache.etag is None:
+        with SessionLocal() as db:
+            warm_country_cache(db)
+
+
+def reset_state():
+    directory.clear()
+    country_cache.clear()
+    directory_version.invalidate()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up()
+    yield
+    reset_state()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=DefaultJSONResponse)
 
 app.include_router(
     swift.router,
     prefix="/v1",
 )
+app.include_router(
+    countries.router,
+    prefix="/v1",
+)
+
+# Does nothing unless PROFILING_ENABLED is on and the request asks for it
+app.add_middleware(ProfilingMiddleware)
+
+
+def metric_engines() -> dict:
+    engines = {"writer": engine}
+    if database.read_engine is not engine:
+        engines["reader"] = database.read_engine
+    if database.async_engine is not None:
+        engines["async_writer"] = database.async_engine.sync_engine
+    if database.async_read_engine not in (None, database.async_engine):
+        engines["async_reader"] = database.async_read_engine.sync_engine
+    return engines
+
+
+if config.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    for name, instrumented in metric_engines().items():
+        metrics.instrument_engine(instrumented, name)
+
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        return Response(
+            content=metrics.render(metric_engines()),
+            media_type="text/plain; version=0.0.4",
+        )
 
 
 @app.get("/")
 def welcome_page():
     return {"Hi": "Welcome"}
 
-
-Base.metadata.create_all(bind=engine)
@@ -0,0 +1,285 @@
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+class CheckoutStats:
+    # How long requests waited for a connection from the pool
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.total_seconds = 0.0
+            self.max_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.count,
+                "wait_seconds_total": self.total_seconds,
+                "wait_seconds_max": self.max_seconds,
+                "wait_seconds_avg": self.total_seconds / self.count
+                if self.count
+                else 0.0,
+            }
+
+
+pool_checkout = CheckoutStats()
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape_label(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self, const_labels: tuple[tuple[str, str], ...] = ()) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        names = self.labelnames + tuple(name for name, _ in const_labels)
+        const = tuple(value for _, value in const_labels)
+        with self._lock:
+            for labels, value in self._values.items():
+                label_text = format_labels(names, labels + const)
+                lines.append(f"{self.name}{label_text} {value}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._values: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                values = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += 1
+            values[-1] += value
+
+    def render(self, const_labels: tuple[tuple[str, str], ...] = ()) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        series_names = self.labelnames + tuple(name for name, _ in const_labels)
+        names = series_names + ("le",)
+        const = tuple(value for _, value in const_labels)
+        with self._lock:
+            for labels, values in self._values.items():
+                labels = labels + const
+                for bound, count in zip(self.buckets, values):
+                    lines.append(
+                        f"{self.name}_bucket{format_labels(names, labels + (bound,))} {count}"
+                    )
+                lines.append(
+                    f"{self.name}_bucket{format_labels(names, labels + ('+Inf',))} {values[-2]}"
+                )
+                label_text = format_labels(series_names, labels)
+                lines.append(f"{self.name}_count{label_text} {values[-2]}")
+                lines.append(f"{self.name}_sum{label_text} {values[-1]}")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+http_requests = Counter(
+    "swift_http_requests_total",
+    "HTTP requests by route and status",
+    ("method", "route", "status"),
+)
+http_latency = Histogram(
+    "swift_http_request_duration_seconds",
+    "HTTP request latency by route and status",
+    ("method", "route", "status"),
+)
+db_queries_per_request = Histogram(
+    "swift_db_queries_per_request",
+    "SQL statements executed per HTTP request",
+    ("route",),
+    QUERY_COUNT_BUCKETS,
+)
+db_time_per_request = Histogram(
+    "swift_db_seconds_per_request",
+    "Time spent in SQL statements per HTTP request",
+    ("route",),
+)
+db_query_duration = Histogram(
+    "swift_db_query_duration_seconds",
+    "Duration of single SQL statements",
+    ("engine",),
+)
+
+REQUEST_METRICS = [
+    http_requests,
+    http_latency,
+    db_queries_per_request,
+    db_time_per_request,
+    db_query_duration,
+]
+
+
+class RequestDBStats:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Set by the middleware, filled in by the SQL hooks. The object is shared (not
+# copied) with the threadpool and with AsyncSession greenlets.
+request_db_stats: ContextVar[Optional[RequestDBStats]] = ContextVar(
+    "request_db_stats", default=None
+)
+
+
+def instrument_engine(sync_engine, name: str):
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["query_start"].pop()
+        db_query_duration.observe((name,), seconds)
+        stats = request_db_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += seconds
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: times the whole response, including streamed bodies
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestDBStats()
+        token = request_db_stats.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            request_db_stats.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            labels = (scope["method"], route_path, str(status))
+            http_requests.inc(labels)
+            http_latency.observe(labels, elapsed)
+            db_queries_per_request.observe((route_path,), stats.queries)
+            db_time_per_request.observe((route_path,), stats.seconds)
+
+
+def pool_lines(engines: dict, worker: str) -> list[str]:
+    lines = [
+        "# HELP swift_db_pool_connections Pooled connections by state",
+        "# TYPE swift_db_pool_connections gauge",
+    ]
+    for name, engine in engines.items():
+        pool = engine.pool
+        # Only QueuePool based pools report sizes
+        if not hasattr(pool, "checkedout"):
+            continue
+        for state, value in (
+            ("size", pool.size()),
+            ("checked_out", pool.checkedout()),
+            ("checked_in", pool.checkedin()),
+            ("overflow", pool.overflow()),
+        ):
+            labels = format_labels(("engine", "state", "worker"), (name, state, worker))
+            lines.append(f"swift_db_pool_connections{labels} {value}")
+
+    stats = pool_checkout.as_dict()
+    labels = format_labels(("worker",), (worker,))
+    lines += [
+        "# HELP swift_db_pool_checkout_wait_seconds Time spent waiting for a pooled connection",
+        "# TYPE swift_db_pool_checkout_wait_seconds summary",
+        f"swift_db_pool_checkout_wait_seconds_count{labels} {stats['checkouts']}",
+        f"swift_db_pool_checkout_wait_seconds_sum{labels} {stats['wait_seconds_total']}",
+        "# HELP swift_db_pool_checkout_wait_seconds_max Longest wait for a pooled connection",
+        "# TYPE swift_db_pool_checkout_wait_seconds_max gauge",
+        f"swift_db_pool_checkout_wait_seconds_max{labels} {stats['wait_seconds_max']}",
+    ]
+    return lines
+
+
+def render(engines: dict) -> str:
+    # Every process keeps its own values. Under gunicorn a scrape reaches one
+    # of the workers, so each series carries the worker's pid: every series
+    # only goes up, and queries aggregate with sum without (worker).
+    worker = str(os.getpid())
+    lines = []
+    for metric in REQUEST_METRICS:
+        lines += metric.render((("worker", worker),))
+    lines += pool_lines(engines, worker)
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,24 @@
 from app.database import Base
-from sqlalchemy import Boolean, Column, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    event,
+    inspect,
+)
 
 
 class SwiftCodeORM(Base):
     __tablename__ = "swift_codes"
+    __table_args__ = (
+        # HQ -> branches lookup is an equality match on (bankCode, isHeadquarter)
+        Index("ix_swift_codes_bankCode_isHeadquarter", "bankCode", "isHeadquarter"),
+        # Country listing filters on countryISO2 and pages in swiftCode order
+        Index("ix_swift_codes_countryISO2_swiftCode", "countryISO2", "swiftCode"),
+    )
 
     swiftCode = Column(String(11), primary_key=True, index=True)
     bankName = Column(String(100), nullable=True)
@@ -11,3 +26,129 @@ class SwiftCodeORM(Base):
     countryISO2 = Column(String(2), nullable=False)
     countryName = Column(String(100), nullable=True)
     isHeadquarter = Column(Boolean, default=False)
+    # First 8 chars of swiftCode (institution + country + location)
+    bankCode = Column(String(8), nullable=True)
+
+
+# Full-text search over bankName/address. SQLite keeps a separate FTS5 table
+# that the writes in app.crud and the importer keep in sync; on PostgreSQL a
+# GIN expression index on swift_codes is maintained by the database itself.
+SEARCH_TABLE = "swift_codes_fts"
+SEARCH_COLUMNS = ("swiftCode", "bankName", "address", "countryISO2")
+# Must match the expression used by app.search to be picked by the planner
+SEARCH_VECTOR_SQL = (
+    "to_tsvector('simple', coalesce(\"bankName\", '') || ' ' || coalesce(address, ''))"
+)
+
+
+def create_search_index(conn, name: str = SEARCH_TABLE):
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+            f"{', '.join(SEARCH_COLUMNS)}, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif conn.dialect.name == "postgresql":
+        conn.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_swift_codes_search "
+            f"ON swift_codes USING gin ({SEARCH_VECTOR_SQL})"
+        )
+
+
+def fill_search_table(conn, name: str = SEARCH_TABLE, source: str = "swift_codes"):
+    columns = ", ".join(f'"{column}"' for column in SEARCH_COLUMNS)
+    conn.exec_driver_sql(
+        f"INSERT INTO {name} ({columns}) SELECT {columns} FROM {source}"
+    )
+
+
+@event.listens_for(SwiftCodeORM.__table__, "after_create")
+def create_search_index_with_table(target, connection, **kw):
+    create_search_index(connection)
+
+
+def ensure_search_index(bind):
+    # Databases created before the search index existed get it on startup
+    with bind.begin() as conn:
+        dialect = conn.dialect.name
+        if dialect == "sqlite" and not inspect(conn).has_table(SEARCH_TABLE):
+            create_search_index(conn)
+            fill_search_table(conn)
+        elif dialect == "postgresql":
+            create_search_index(conn)
+
+
+class DirectoryVersionORM(Base):
+    # Single row, version is bumped in the same transaction as every write to
+    # swift_codes. epoch changes when the database is recreated or a CSV is
+    # imported.
+    __tablename__ = "directory_version"
+
+    id = Column(Integer, primary_key=True)
+    epoch = Column(String(32), nullable=False)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class DirectoryChangeORM(Base):
+    # Codes written at each directory version of the current epoch, so a worker
+    # with a stale in-memory directory applies just these instead of reloading
+    # the table. Old versions are pruned, an import starts over.
+    __tablename__ = "directory_changes"
+
+    version = Column(Integer, primary_key=True)
+    swiftCode = Column(String(11), primary_key=True)
+    # "upsert" or "delete"
+    operation = Column(String(6), nullable=False)
+
+
+class ImportMetadataORM(Base):
+    # Single row describing the CSV the swift_codes rows were loaded from, so
+    # an unchanged file is not imported again
+    __tablename__ = "import_metadata"
+
+    id = Column(Integer, primary_key=True)
+    source = Column(String(500), nullable=False)
+    fingerprint = Column(String(100), nullable=False)
+    rows = Column(Integer, nullable=False)
+    imported_at = Column(DateTime, nullable=False)
+
+
+class CountrySummaryORM(Base):
+    # Code counts per country, kept up to date in the same transaction as every
+    # write to swift_codes so country metadata is a primary key read
+    __tablename__ = "country_summary"
+
+    countryISO2 = Column(String(2), primary_key=True)
+    countryName = Column(String(100), nullable=True)
+    totalCodes = Column(Integer, nullable=False)
+    headquarters = Column(Integer, nullable=False)
+    branches = Column(Integer, nullable=False)
+    lastModified = Column(DateTime, nullable=False)
+
+
+# Column sets that must be covered by an index (or the primary key) before the
+# API can serve traffic without falling back to full table scans
+REQUIRED_INDEXES = [
+    ("swiftCode",),
+    ("countryISO2", "swiftCode"),
+    ("bankCode", "isHeadquarter"),
+]
+
+
+def missing_indexes(bind) -> list[tuple[str, ...]]:
+    inspector = inspect(bind)
+    if not inspector.has_table(SwiftCodeORM.__tablename__):
+        return list(REQUIRED_INDEXES)
+
+    covered = {
+        tuple(index["column_names"])
+        for index in inspector.get_indexes(SwiftCodeORM.__tablename__)
+    }
+    primary_key = inspector.get_pk_constraint(SwiftCodeORM.__tablename__)
+    covered.add(tuple(primary_key["constrained_columns"]))
+    # An index also serves lookups on any leading subset of its columns
+    return [
+        columns
+        for columns in REQUIRED_INDEXES
+        if not any(index[: len(columns)] == columns for index in covered)
+    ]
@@ -1,5 +1,6 @@
+from datetime import datetime
 from pydantic import BaseModel, Field, field_validator, ConfigDict
-from typing import Annotated, Optional
+from typing import Annotated, Literal, Optional, Union
 
 
 class Swift_Code(BaseModel):
@@ -66,8 +67,9 @@ class Swift_Code(BaseModel):
 
 
 class Switf_Branch(BaseModel):
-    address: str
-    bankName: str
+    # address and bankName are optional on Swift_Code, so they can be null here too
+    address: Optional[str]
+    bankName: Optional[str]
     countryISO2: str
     isHeadquarter: bool
     swiftCode: str
@@ -83,7 +85,7 @@ class Swift_with_Branches(Swift_Code):
 
 class Swift_on_country(BaseModel):
     countryISO2: str
-    countryName: str
+    countryName: Optional[str]
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -92,3 +94,111 @@ class Swift_with_Branches_country(Swift_on_country):
     swiftCodes: list[Switf_Branch]
 
     model_config = ConfigDict(from_attributes=True)
+
+
+# Field order of the JSON responses, used when rows are serialised directly
+# instead of going through the models
+SWIFT_CODE_FIELDS = tuple(Swift_Code.model_fields)
+BRANCH_FIELDS = tuple(Switf_Branch.model_fields)
+
+
+class Swift_lookup(BaseModel):
+    swiftCodes: list[
+        Annotated[
+            str,
+            Field(
+                min_length=11,
+                max_length=11,
+                description="SWIFT code must be exactly 11 characters",
+            ),
+        ]
+    ] = Field(min_length=1, max_length=1000)
+
+
+class Swift_lookup_result(BaseModel):
+    swiftCode: str
+    found: bool
+    data: Optional[Union[Swift_with_Branches, Swift_Code]] = None
+
+
+class Swift_lookup_response(BaseModel):
+    results: list[Swift_lookup_result]
+
+
+class Swift_bulk_create(BaseModel):
+    swiftCodes: list[Swift_Code] = Field(min_length=1, max_length=10000)
+
+    @field_validator("swiftCodes")
+    @classmethod
+    def unique_codes(cls, items: list[Swift_Code]):
+        # Codes are uppercased by Swift_Code, so "abc..." and "ABC..." collide
+        seen = set()
+        duplicates = set()
+        for item in items:
+            if item.swiftCode in seen:
+                duplicates.add(item.swiftCode)
+            seen.add(item.swiftCode)
+        if duplicates:
+            raise ValueError(
+                f"Duplicate SWIFT codes in the batch: {', '.join(sorted(duplicates))}"
+            )
+        return items
+
+
+class Swift_bulk_delete(BaseModel):
+    swiftCodes: list[
+        Annotated[
+            str,
+            Field(
+                min_length=11,
+                max_length=11,
+                description="SWIFT code must be exactly 11 characters",
+            ),
+        ]
+    ] = Field(min_length=1, max_length=10000)
+
+
+class Swift_bulk_result(BaseModel):
+    swiftCode: str
+    status: Literal["created", "updated", "skipped", "deleted", "not_found"]
+
+
+class Swift_bulk_response(BaseModel):
+    results: list[Swift_bulk_result]
+
+
+class Swift_search_response(BaseModel):
+    results: list[Swift_Code]
+    limit: int
+    offset: int
+    # Offset of the next page, None on the last page
+    next_offset: Optional[int] = None
+
+
+class Swift_prefix_match(BaseModel):
+    swiftCode: str
+    bankName: Optional[str] = None
+    isHeadquarter: bool
+
+
+class Swift_prefix_response(BaseModel):
+    results: list[Swift_prefix_match]
+
+
+PREFIX_FIELDS = tuple(Swift_prefix_match.model_fields)
+
+
+class Country_summary(BaseModel):
+    countryISO2: str
+    countryName: Optional[str]
+    totalCodes: int
+    headquarters: int
+    branches: int
+    lastModified: datetime
+
+
+class Country_summary_list(BaseModel):
+    countries: list[Country_summary]
+
+
+COUNTRY_SUMMARY_FIELDS = tuple(Country_summary.model_fields)
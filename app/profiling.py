@@ -0,0 +1,228 @@
+import cProfile
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Optional
+from urllib.parse import parse_qs
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import config
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_VALUES = ("1", "true", "yes", "on")
+NO_PROFILE = nullcontext()
+
+
+class RequestProfile:
+    # Timing entries of one request. Every entry is exclusive time: a span
+    # does not include the SQL statements or spans recorded inside it.
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.entries: list[tuple[str, float, str]] = []
+        self.statements: list[dict] = []
+        self._accounted = 0.0
+
+    def record(self, name: str, seconds: float, description: str = ""):
+        self.entries.append((name, seconds, description))
+        self._accounted += seconds
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        accounted = self._accounted
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.record(name, elapsed - (self._accounted - accounted))
+
+    def exclude(self, seconds: float):
+        # Profiler overhead (EXPLAIN), kept out of the enclosing span
+        self._accounted += seconds
+
+    def add_statement(self, statement: str, seconds: float, plan: list[str]):
+        number = len(self.statements) + 1
+        self.statements.append(
+            {"statement": statement, "seconds": seconds, "plan": plan}
+        )
+        self.record(f"sql-{number}", seconds, "; ".join(plan) or statement)
+
+    def server_timing(self) -> str:
+        metrics = []
+        for name, seconds, description in self.entries:
+            metric = f"{name};dur={seconds * 1000:.3f}"
+            if description:
+                metric += f';desc="{quote(description)}"'
+            metrics.append(metric)
+        total = time.perf_counter() - self.start
+        metrics.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(metrics)
+
+    def as_dict(self) -> dict:
+        return {
+            "total_seconds": time.perf_counter() - self.start,
+            "entries": [
+                {"name": name, "seconds": seconds, "description": description}
+                for name, seconds, description in self.entries
+            ],
+            "statements": self.statements,
+        }
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar(
+    "current_profile", default=None
+)
+
+
+def quote(text: str) -> str:
+    # Server-Timing desc is a quoted string on a single header line
+    text = " ".join(text.split())[:200]
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def profile_span(name: str):
+    profile = current_profile.get()
+    if profile is None:
+        return NO_PROFILE
+    return profile.span(name)
+
+
+def record(name: str, seconds: float):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record(name, seconds)
+
+
+def explain(conn, statement: str, parameters) -> list[str]:
+    # EXPLAIN QUERY PLAN on a separate DBAPI cursor, so the statement's own
+    # cursor and the SQLAlchemy events are left alone
+    if conn.dialect.name != "sqlite" or not statement.lstrip().upper().startswith(
+        "SELECT"
+    ):
+        return []
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    if profile is None:
+        return
+    plan = []
+    if not executemany:
+        start = time.perf_counter()
+        plan = explain(conn, statement, parameters)
+        profile.exclude(time.perf_counter() - start)
+    conn.info.setdefault("profile_query", []).append((time.perf_counter(), plan))
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    pending = conn.info.get("profile_query")
+    if profile is None or not pending:
+        return
+    start, plan = pending.pop()
+    profile.add_statement(statement, time.perf_counter() - start, plan)
+
+
+_hooks_lock = threading.Lock()
+# One cProfile at a time per process: from Python 3.12 a second enable() raises
+# ValueError, before that it silently takes over from the running one
+_profiler_lock = threading.Lock()
+
+
+def install_sql_hooks():
+    # Installed on the first profiled request, so there is no per-statement
+    # cost until profiling is actually used
+    with _hooks_lock:
+        if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+
+def profile_requested(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return value.decode().strip().lower() in PROFILE_VALUES
+    query = parse_qs(scope.get("query_string", b"").decode())
+    return any(value.lower() in PROFILE_VALUES for value in query.get("profile", []))
+
+
+def dump_profile(scope, profile: RequestProfile, profiler: cProfile.Profile):
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    route = getattr(scope.get("route"), "path", scope["path"])
+    name = "-".join(
+        [
+            time.strftime("%Y%m%dT%H%M%S"),
+            f"{time.time_ns() % 1_000_000_000:09d}",
+            scope["method"],
+            route.strip("/").replace("/", "_").replace("{", "").replace("}", ""),
+        ]
+    )
+    path = os.path.join(config.PROFILE_DIR, name)
+    profiler.dump_stats(f"{path}.prof")
+    with open(f"{path}.json", "w") as file:
+        json.dump({"path": scope["path"], **profile.as_dict()}, file, indent=2)
+
+
+class ProfilingMiddleware:
+    # Only requests that ask for it are profiled. cProfile sees the event loop
+    # thread only, work done in the threadpool shows up in the timings.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not config.PROFILING_ENABLED
+            or not profile_requested(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        install_sql_hooks()
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        profiler = None
+        # A sampled request that overlaps a running profile keeps its timings
+        # but is not dumped
+        if (
+            config.PROFILE_DIR
+            and random.random() < config.PROFILE_SAMPLE_RATE
+            and _profiler_lock.acquire(blocking=False)
+        ):
+            profiler = cProfile.Profile()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", profile.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        finally:
+            current_profile.reset(token)
+            if profiler is not None:
+                _profiler_lock.release()
+        if profiler is not None:
+            dump_profile(scope, profile, profiler)
@@ -0,0 +1,59 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Request, Response
+from pydantic import TypeAdapter
+
+from app import crud
+from app.database import DBSession, get_read_db, run_db
+from app.http_cache import not_modified
+from app.models import Country_summary, Country_summary_list
+from app.serialization import DefaultJSONResponse, json_response
+
+router = APIRouter(default_response_class=DefaultJSONResponse)
+
+summary_adapter = TypeAdapter(Country_summary)
+summary_list_adapter = TypeAdapter(Country_summary_list)
+
+
+# Country metadata from the country_summary table, without reading swift_codes
+@router.get("/countries", response_model=Country_summary_list)
+async def list_countries(
+    request: Request,
+    response: Response,
+    db: DBSession = Depends(get_read_db),
+):
+    cached = await not_modified(request, response, db)
+    if cached is not None:
+        return cached
+
+    countries = await run_db(db, crud.list_country_summaries)
+    return json_response(
+        {"countries": countries},
+        headers=response.headers,
+        adapter=summary_list_adapter,
+    )
+
+
+@router.get("/countries/{countryISO2code}", response_model=Country_summary)
+async def get_country(
+    countryISO2code: Annotated[
+        str,
+        Path(
+            min_length=2,
+            max_length=2,
+            pattern=r"^[a-zA-Z]{2}$",
+            description="countryISO2 must be a 2-letter alphabetic code (e.g., PL, CH)",
+        ),
+    ],
+    request: Request,
+    response: Response,
+    db: DBSession = Depends(get_read_db),
+):
+    cached = await not_modified(request, response, db)
+    if cached is not None:
+        return cached
+
+    country = await run_db(db, crud.get_country_summary, countryISO2code.upper())
+    if country is None:
+        raise HTTPException(status_code=404, detail="Country code does not exists")
+    return json_response(country, headers=response.headers, adapter=summary_adapter)
@@ -1,33 +1,160 @@
-from typing import Annotated, Union
+from typing import Annotated, Literal, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException, Path
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 
-from app.database import SessionLocal
-from app.model_orm import SwiftCodeORM
+from app import config, crud
+from app.database import DBSession, get_db, get_read_db, run_db
+from app.directory import directory
+from app.http_cache import (
+    country_cache,
+    directory_is_current,
+    not_modified,
+    record_change,
+    serialise_country,
+)
+from app.search import search_swift_codes, search_terms
+from app.streaming import MEDIA_TYPES, stream_export
+from app.profiling import profile_span
 from app.models import (
+    Swift_bulk_create,
+    Swift_bulk_delete,
+    Swift_bulk_response,
+    Swift_bulk_result,
     Swift_Code,
+    Swift_lookup,
+    Swift_lookup_response,
+    Swift_prefix_response,
+    Swift_search_response,
     Swift_with_Branches,
-    Swift_with_Branches_country,
-    Switf_Branch,
 )
+from app.serialization import DefaultJSONResponse, json_response
+
+router = APIRouter(default_response_class=DefaultJSONResponse)
+
+# Only used when VALIDATE_RESPONSES is on, responses are built from plain dicts
+swift_code_adapter = TypeAdapter(Union[Swift_with_Branches, Swift_Code])
+lookup_adapter = TypeAdapter(Swift_lookup_response)
+search_adapter = TypeAdapter(Swift_search_response)
+prefix_adapter = TypeAdapter(Swift_prefix_response)
+
+
+# Declared before /swift-codes/{swift_code} so "export" is not taken as a code
+@router.get("/swift-codes/export")
+async def export_swift_codes(
+    country: Annotated[
+        Optional[str],
+        Query(
+            min_length=2,
+            max_length=2,
+            pattern=r"^[a-zA-Z]{2}$",
+            description="Export only this country, omit for the whole directory",
+        ),
+    ] = None,
+    format: Annotated[
+        Literal["ndjson", "csv"], Query(description="ndjson (default) or csv")
+    ] = "ndjson",
+    db: DBSession = Depends(get_read_db),
+):
+    return StreamingResponse(
+        stream_export(db, country.upper() if country else None, format),
+        media_type=MEDIA_TYPES[format],
+    )
+
+
+# Declared before /swift-codes/{swift_code} so "search" is not taken as a code
+@router.get("/swift-codes/search", response_model=Swift_search_response)
+async def search_swift_codes_by_name(
+    q: Annotated[
+        str,
+        Query(
+            min_length=1,
+            max_length=200,
+            description="Words of the bank name or address",
+        ),
+    ],
+    request: Request,
+    response: Response,
+    country: Annotated[
+        Optional[str],
+        Query(
+            min_length=2,
+            max_length=2,
+            pattern=r"^[a-zA-Z]{2}$",
+            description="Only codes of this country",
+        ),
+    ] = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    offset: Annotated[int, Query(ge=0, le=10000)] = 0,
+    db: DBSession = Depends(get_read_db),
+):
+    terms = search_terms(q)
+    if not terms:
+        raise HTTPException(status_code=422, detail="Query has no searchable words")
+
+    cached = await not_modified(request, response, db)
+    if cached is not None:
+        return cached
 
-router = APIRouter()
+    # Results stop at SEARCH_RANK_WINDOW, the page reaching it is the last one.
+    # One extra row tells whether there is a next page.
+    page_size = min(limit, config.SEARCH_RANK_WINDOW - offset)
+    results = []
+    if page_size > 0:
+        results = await run_db(
+            db,
+            search_swift_codes,
+            terms,
+            country.upper() if country else None,
+            page_size + 1,
+            offset,
+        )
+    next_offset = None
+    if len(results) > page_size:
+        results = results[:page_size]
+        if offset + limit < config.SEARCH_RANK_WINDOW:
+            next_offset = offset + limit
+    return json_response(
+        {
+            "results": results,
+            "limit": limit,
+            "offset": offset,
+            "next_offset": next_offset,
+        },
+        headers=response.headers,
+        adapter=search_adapter,
+    )
 
 
-def get_db():
-    try:
-        db = SessionLocal()
-        yield db
-    finally:
-        db.close()
+@router.get("/swift-codes/prefix/{partial}", response_model=Swift_prefix_response)
+async def swift_codes_by_prefix(
+    partial: Annotated[
+        str,
+        Path(
+            min_length=4,
+            max_length=11,
+            description="First 4 to 11 characters of a SWIFT code",
+        ),
+    ],
+    limit: Annotated[int, Query(ge=1, le=100)] = 10,
+    db: DBSession = Depends(get_read_db),
+):
+    partial = partial.upper()
+    # No ETag check here, the version check reads the database at most once
+    # per DIRECTORY_VERSION_TTL
+    if await directory_is_current(db):
+        results = directory.prefix(partial, limit)
+    else:
+        results = await run_db(db, crud.get_codes_by_prefix, partial, limit)
+    return json_response({"results": results}, adapter=prefix_adapter)
 
 
 @router.get(
     "/swift-codes/{swift_code}",
     response_model=Union[Swift_Code, Swift_with_Branches],
 )
-def get_swift_code(
+async def get_swift_code(
     swift_code: Annotated[
         str,
         Path(
@@ -36,36 +163,27 @@ def get_swift_code(
             description="SWIFT code must be exactly 11 characters",
         ),
     ],
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: DBSession = Depends(get_read_db),
 ):
-    swift_code = swift_code.upper()
-    branches_data = []
-    code = db.query(SwiftCodeORM).filter_by(swiftCode=swift_code).first()
-    if not code:
-        raise HTTPException(status_code=404, detail="SWIFT code not found")
-    if code.isHeadquarter:
-        branches = (
-            db.query(SwiftCodeORM)
-            .filter(
-                SwiftCodeORM.swiftCode.startswith(code.swiftCode[:8]),
-                SwiftCodeORM.isHeadquarter == False,
-            )
-            .all()
-        )
-        for branch in branches:
-            branches_data.append(
-                Switf_Branch.model_validate(branch, from_attributes=True)
-            )
-
-        base_hq = Swift_Code.model_validate(code, from_attributes=True)
-        return Swift_with_Branches(**base_hq.model_dump(), branches=branches_data)
+    cached = await not_modified(request, response, db)
+    if cached is not None:
+        return cached
 
+    swift_code = swift_code.upper()
+    if await directory_is_current(db):
+        with profile_span("snapshot"):
+            code = directory.response(swift_code)
     else:
-        return Swift_Code.model_validate(code)
+        code = await run_db(db, crud.get_swift_code, swift_code)
+    if code is None:
+        raise HTTPException(status_code=404, detail="SWIFT code not found")
+    return json_response(code, headers=response.headers, adapter=swift_code_adapter)
 
 
 @router.get("/swift-codes/country/{countryISO2code}")
-def swift_codes_on_country(
+async def swift_codes_on_country(
     countryISO2code: Annotated[
         str,
         Path(
@@ -75,37 +193,160 @@ def swift_codes_on_country(
             description="countryISO2 must be a 2-letter alphabetic code (e.g., PL, CH)",
         ),
     ],
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    limit: Annotated[
+        Optional[int],
+        Query(ge=1, le=10000, description="Page size, omit to get every code"),
+    ] = None,
+    after: Annotated[
+        Optional[str],
+        Query(
+            min_length=11,
+            max_length=11,
+            description="Return codes after this one (next_cursor of the previous page)",
+        ),
+    ] = None,
+    fields: Annotated[
+        Optional[str],
+        Query(description="Comma separated fields to return, swiftCode is always included"),
+    ] = None,
+    db: DBSession = Depends(get_read_db),
 ):
+    cached = await not_modified(request, response, db)
+    if cached is not None:
+        return cached
+
     countryISO2code = countryISO2code.upper()
 
-    codes = db.query(SwiftCodeORM).filter_by(countryISO2=countryISO2code).all()
-    if not codes:
+    # Without paging or projection keep the original response, served as
+    # pre-serialised bytes from the country cache
+    if limit is None and after is None and fields is None:
+        etag = response.headers["etag"]
+        body = country_cache.get(countryISO2code, etag)
+        if body is None:
+            country = await run_db(db, crud.get_country, countryISO2code)
+            if country is None:
+                raise HTTPException(
+                    status_code=404, detail="Country code does not exists"
+                )
+            body = serialise_country(country)
+            country_cache.put(countryISO2code, etag, body)
+        return Response(
+            content=body, media_type="application/json", headers=response.headers
+        )
+
+    selected = list(crud.BRANCH_FIELDS)
+    if fields is not None:
+        selected = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = set(selected) - set(crud.BRANCH_FIELDS)
+        if unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+            )
+        if "swiftCode" not in selected:
+            selected.append("swiftCode")
+
+    page = await run_db(
+        db,
+        crud.get_country_page,
+        countryISO2code,
+        limit,
+        after.upper() if after else None,
+        selected,
+    )
+    if page is None:
         raise HTTPException(status_code=404, detail="Country code does not exists")
+    return page
+
+
+@router.post("/swift-codes/lookup", response_model=Swift_lookup_response)
+async def lookup_swift_codes(body: Swift_lookup, db: DBSession = Depends(get_read_db)):
+    swift_codes = [code.upper() for code in body.swiftCodes]
+    # found only holds the codes that exist, from either path
+    if await directory_is_current(db):
+        found = {}
+        for code in set(swift_codes):
+            item = directory.response(code)
+            if item is not None:
+                found[code] = item
+    else:
+        found = await run_db(db, crud.lookup_swift_codes, swift_codes)
+
+    results = [
+        {"swiftCode": code, "found": code in found, "data": found.get(code)}
+        for code in swift_codes
+    ]
+    return json_response({"results": results}, adapter=lookup_adapter)
+
+
+@router.post("/swift-codes/bulk", response_model=Swift_bulk_response)
+async def bulk_add_swift(
+    body: Swift_bulk_create,
+    on_conflict: Annotated[
+        Literal["fail", "skip", "upsert"],
+        Query(description="What to do with codes that already exist"),
+    ] = "fail",
+    db: DBSession = Depends(get_db),
+):
+    results, conflicts, change = await run_db(
+        db, crud.bulk_add_swift, body.swiftCodes, on_conflict
+    )
+    if conflicts:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "SWIFT codes already exist", "swiftCodes": conflicts},
+        )
+
+    record_change(change)
+    if directory.loaded:
+        directory.add_many(
+            item.model_dump()
+            for item, (_, status) in zip(body.swiftCodes, results)
+            if status != "skipped"
+        )
+    return Swift_bulk_response(
+        results=[
+            Swift_bulk_result(swiftCode=code, status=status)
+            for code, status in results
+        ]
+    )
+
+
+# Declared before /swift-codes/{swift_code} so "bulk" is not taken as a code
+@router.delete("/swift-codes/bulk", response_model=Swift_bulk_response)
+async def bulk_delete_swift_codes(
+    body: Swift_bulk_delete, db: DBSession = Depends(get_db)
+):
+    swift_codes = [code.upper() for code in body.swiftCodes]
+    results, change = await run_db(db, crud.bulk_delete_swift_codes, swift_codes)
 
-    country_name = codes[0].countryName
-    branches_data = []
-    for item in codes:
-        branches_data.append(Switf_Branch(**item.__dict__))
-    return Swift_with_Branches_country(
-        countryISO2=countryISO2code, countryName=country_name, swiftCodes=branches_data
+    record_change(change)
+    if directory.loaded:
+        directory.remove_many(code for code, status in results if status == "deleted")
+    return Swift_bulk_response(
+        results=[
+            Swift_bulk_result(swiftCode=code, status=status)
+            for code, status in results
+        ]
     )
 
 
 @router.post("/swift-codes", status_code=201)
-def add_swift(body: Swift_Code, db: Session = Depends(get_db)):
-    exists = db.query(SwiftCodeORM).filter_by(swiftCode=body.swiftCode).first()
-    if exists:
+async def add_swift(body: Swift_Code, db: DBSession = Depends(get_db)):
+    change = await run_db(db, crud.add_swift, body)
+    if change is None:
         raise HTTPException(status_code=409, detail="SWIFT code already exists")
 
-    new_item = SwiftCodeORM(**body.model_dump())
-    db.add(new_item)
-    db.commit()
+    record_change(change)
+    if directory.loaded:
+        directory.add(body.model_dump())
     return {"message": "SWIFT code added successfully"}
 
 
 @router.delete("/swift-codes/{swift_code}", status_code=200)
-def delete_swift_code(
+async def delete_swift_code(
     swift_code: Annotated[
         str,
         Path(
@@ -114,12 +355,13 @@ def delete_swift_code(
             description="SWIFT code must be exactly 11 characters",
         ),
     ],
-    db: Session = Depends(get_db),
+    db: DBSession = Depends(get_db),
 ):
     swift_code = swift_code.upper()
-    exists = db.query(SwiftCodeORM).filter_by(swiftCode=swift_code).first()
-    if not exists:
+    change = await run_db(db, crud.delete_swift_code, swift_code)
+    if change is None:
         raise HTTPException(status_code=404, detail="SWIFT code not found")
-    db.delete(exists)
-    db.commit()
+    record_change(change)
+    if directory.loaded:
+        directory.remove(swift_code)
     return {"message": f"SWIFT code {swift_code} deleted successfully"}
@@ -0,0 +1,176 @@
+import re
+from typing import Iterable, Optional, Union
+
+from sqlalchemy import (
+    Connection,
+    and_,
+    bindparam,
+    column,
+    delete,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.orm import Session
+
+from app import config
+from app.model_orm import SEARCH_COLUMNS, SEARCH_TABLE, SEARCH_VECTOR_SQL, SwiftCodeORM
+from app.models import SWIFT_CODE_FIELDS
+
+MAX_SEARCH_TERMS = 10
+# Codes per DELETE when removing rows from the FTS table
+UNINDEX_BATCH_SIZE = 500
+
+CODE_COLUMNS = [getattr(SwiftCodeORM, field) for field in SWIFT_CODE_FIELDS]
+
+search_table = table(SEARCH_TABLE, *(column(name) for name in SEARCH_COLUMNS))
+
+
+def dialect_name(db: Union[Session, Connection]) -> str:
+    if isinstance(db, Connection):
+        return db.dialect.name
+    return db.get_bind().dialect.name
+
+
+def search_terms(q: str) -> list[str]:
+    # Only word characters reach the query, so user input can never be read
+    # as FTS5 / tsquery syntax
+    return re.findall(r"\w+", q)[:MAX_SEARCH_TERMS]
+
+
+def fts_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def fts_match(terms: list[str], countryISO2: Optional[str]) -> str:
+    # Every term must match a whole word of bankName or address. No prefix
+    # queries: for a common prefix FTS5 has to merge huge doclists.
+    phrases = " ".join(fts_phrase(term) for term in terms)
+    match = "{bankName address} : (" + phrases + ")"
+    if countryISO2:
+        match += f" AND countryISO2 : {fts_phrase(countryISO2)}"
+    return match
+
+
+def index_codes(db: Union[Session, Connection], rows: Iterable[dict]):
+    if dialect_name(db) != "sqlite":
+        return
+    rows = [{name: row.get(name) for name in SEARCH_COLUMNS} for row in rows]
+    if rows:
+        db.execute(insert(search_table), rows)
+
+
+def unindex_codes(db: Union[Session, Connection], swift_codes: Iterable[str]):
+    # Rows are found through the FTS index on swiftCode, the IN filter keeps
+    # the match exact
+    if dialect_name(db) != "sqlite":
+        return
+    swift_codes = list(swift_codes)
+    for start in range(0, len(swift_codes), UNINDEX_BATCH_SIZE):
+        batch = swift_codes[start : start + UNINDEX_BATCH_SIZE]
+        match = "swiftCode : (" + " OR ".join(fts_phrase(code) for code in batch) + ")"
+        matching = (
+            select(literal_column("rowid"))
+            .select_from(search_table)
+            .where(
+                text(f"{SEARCH_TABLE} MATCH :match").bindparams(match=match),
+                search_table.c.swiftCode.in_(batch),
+            )
+        )
+        db.execute(
+            delete(search_table).where(literal_column("rowid").in_(matching))
+        )
+
+
+def search_swift_codes(
+    db: Session,
+    terms: list[str],
+    countryISO2: Optional[str],
+    limit: int,
+    offset: int,
+) -> list[dict]:
+    dialect = dialect_name(db)
+    if dialect == "sqlite":
+        return search_sqlite(db, terms, countryISO2, limit, offset)
+    if dialect == "postgresql":
+        return search_postgres(db, terms, countryISO2, limit, offset)
+    return search_like(db, terms, countryISO2, limit, offset)
+
+
+def search_sqlite(db, terms, countryISO2, limit, offset) -> list[dict]:
+    # Only the first SEARCH_RANK_WINDOW matches in index order are scored and
+    # ranked, then just the requested page is fetched from swift_codes by
+    # primary key. Scoring every match of a word found in most rows takes
+    # seconds, so for such words the ranking is approximate.
+    # bm25 weights: swiftCode and countryISO2 do not count, a bankName hit
+    # counts more than an address hit.
+    candidates = (
+        select(
+            search_table.c.swiftCode,
+            literal_column(f"bm25({SEARCH_TABLE}, 0.0, 10.0, 2.0, 0.0)").label(
+                "score"
+            ),
+        )
+        .where(text(f"{SEARCH_TABLE} MATCH :match"))
+        .limit(config.SEARCH_RANK_WINDOW)
+        .subquery()
+    )
+    hits = (
+        select(candidates)
+        .order_by(candidates.c.score, candidates.c.swiftCode)
+        .limit(limit)
+        .offset(offset)
+        .subquery()
+    )
+    rows = db.execute(
+        select(*CODE_COLUMNS)
+        .join(hits, hits.c.swiftCode == SwiftCodeORM.swiftCode)
+        .order_by(hits.c.score, hits.c.swiftCode),
+        {"match": fts_match(terms, countryISO2)},
+    )
+    return [row._asdict() for row in rows]
+
+
+def search_postgres(db, terms, countryISO2, limit, offset) -> list[dict]:
+    vector = literal_column(SEARCH_VECTOR_SQL)
+    query = func.to_tsquery(
+        literal_column("'simple'"), bindparam("tsquery", " & ".join(terms))
+    )
+    candidates = select(
+        *CODE_COLUMNS, func.ts_rank(vector, query).label("score")
+    ).where(vector.op("@@")(query))
+    if countryISO2:
+        candidates = candidates.where(SwiftCodeORM.countryISO2 == countryISO2)
+    candidates = candidates.limit(config.SEARCH_RANK_WINDOW).subquery()
+    statement = (
+        select(*(candidates.c[field] for field in SWIFT_CODE_FIELDS))
+        .order_by(candidates.c.score.desc(), candidates.c.swiftCode)
+        .limit(limit)
+        .offset(offset)
+    )
+    return [row._asdict() for row in db.execute(statement)]
+
+
+def search_like(db, terms, countryISO2, limit, offset) -> list[dict]:
+    # Databases without a full-text index: substring scan, kept for completeness
+    conditions = [
+        or_(
+            SwiftCodeORM.bankName.icontains(term, autoescape=True),
+            SwiftCodeORM.address.icontains(term, autoescape=True),
+        )
+        for term in terms
+    ]
+    if countryISO2:
+        conditions.append(SwiftCodeORM.countryISO2 == countryISO2)
+    statement = (
+        select(*CODE_COLUMNS)
+        .where(and_(*conditions))
+        .order_by(SwiftCodeORM.swiftCode)
+        .limit(limit)
+        .offset(offset)
+    )
+    return [row._asdict() for row in db.execute(statement)]
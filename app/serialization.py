@@ -0,0 +1,38 @@
+from typing import Any, Mapping, Optional
+
+from fastapi import Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+
+from app import config
+from app.profiling import profile_span
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib json encoder
+    orjson = None
+
+
+def default_response_class() -> type[JSONResponse]:
+    if config.ORJSON_RESPONSES and orjson is not None:
+        return ORJSONResponse
+    return JSONResponse
+
+
+DefaultJSONResponse = default_response_class()
+
+
+def json_response(
+    payload: Any,
+    headers: Optional[Mapping[str, str]] = None,
+    adapter: Optional[TypeAdapter] = None,
+) -> Response:
+    # Serialise plain dicts/lists straight to JSON in one pass. Returning a
+    # Response also skips FastAPI's response_model validation.
+    if adapter is not None and config.VALIDATE_RESPONSES:
+        with profile_span("validate"):
+            adapter.validate_python(payload)
+    with profile_span("encode"):
+        content = to_json(payload)
+    return Response(content=content, media_type="application/json", headers=headers)
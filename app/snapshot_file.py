@@ -0,0 +1,138 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from typing import NamedTuple, Optional
+
+from app.columnar import CODE_WIDTH, COUNTRY_WIDTH, ColumnarStore, StringTable
+
+# Binary copy of the in-memory directory, written after an import and mapped
+# read-only by every worker, so they share the same pages and start without
+# reading the table. Layout (little-endian):
+#
+#   header    magic, format version, directory epoch and version, rows
+#   sections  (offset, length) of each entry of SECTIONS
+#   data      the ColumnarStore buffers, each 8-byte aligned, then the rows
+#             kept outside the store as JSON
+#
+# The file is replaced atomically, workers still mapping the old one keep it.
+
+MAGIC = b"SWIFTDIR"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sI32sQQ")
+SECTION = struct.Struct("<QQ")
+SECTIONS = (
+    "codes",
+    "countries",
+    "hq",
+    "bank_names",
+    "addresses",
+    "country_names",
+    "string_offsets",
+    "strings",
+    "overlay",
+)
+ALIGNMENT = 8
+
+
+class SnapshotFile(NamedTuple):
+    store: ColumnarStore
+    overlay: dict[str, dict]
+    epoch: str
+    version: int
+
+
+def write_snapshot(
+    path: str,
+    store: ColumnarStore,
+    overlay: dict[str, dict],
+    epoch: str,
+    version: int,
+):
+    if sys.byteorder != "little":
+        return
+    sections = [
+        store.codes.buffer,
+        store.countries,
+        store.hq,
+        store.bank_names,
+        store.addresses,
+        store.country_names,
+        store.strings.offsets,
+        store.strings.blob,
+        json.dumps(list(overlay.values())).encode(),
+    ]
+    offset = HEADER.size + SECTION.size * len(SECTIONS)
+    table = []
+    for section in sections:
+        offset += -offset % ALIGNMENT
+        length = memoryview(section).nbytes
+        table.append((offset, length))
+        offset += length
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(
+                HEADER.pack(
+                    MAGIC, FORMAT_VERSION, epoch.encode("ascii"), version, len(store)
+                )
+            )
+            for entry in table:
+                file.write(SECTION.pack(*entry))
+            for (start, _), section in zip(table, sections):
+                file.write(bytes(start - file.tell()))
+                file.write(section)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_snapshot(path: str) -> Optional[SnapshotFile]:
+    # None when there is no usable file, the caller then loads the database
+    if sys.byteorder != "little":
+        return None
+    try:
+        file = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with file:
+        size = os.fstat(file.fileno()).st_size
+        header_size = HEADER.size + SECTION.size * len(SECTIONS)
+        if size < header_size:
+            return None
+        # The mapping stays valid after the file is closed or replaced
+        view = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    magic, format_version, epoch, version, rows = HEADER.unpack_from(view)
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        return None
+    sections = {}
+    for i, name in enumerate(SECTIONS):
+        start, length = SECTION.unpack_from(view, HEADER.size + i * SECTION.size)
+        if start + length > size:
+            return None
+        sections[name] = view[start : start + length]
+    if (
+        len(sections["codes"]) != rows * CODE_WIDTH
+        or len(sections["countries"]) != rows * COUNTRY_WIDTH
+    ):
+        return None
+
+    store = ColumnarStore(
+        sections["codes"],
+        sections["countries"],
+        sections["hq"],
+        sections["bank_names"].cast("I"),
+        sections["addresses"].cast("I"),
+        sections["country_names"].cast("I"),
+        StringTable(sections["string_offsets"].cast("I"), sections["strings"]),
+    )
+    overlay = {
+        item["swiftCode"]: item for item in json.loads(bytes(sections["overlay"]))
+    }
+    return SnapshotFile(store, overlay, epoch.rstrip(b"\0").decode("ascii"), version)
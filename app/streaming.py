@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+from typing import Optional
+
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import DBSession
+from app.model_orm import SwiftCodeORM
+
+EXPORT_FIELDS = (
+    "swiftCode",
+    "bankName",
+    "address",
+    "countryISO2",
+    "countryName",
+    "isHeadquarter",
+)
+EXPORT_BATCH_SIZE = 1000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def export_statement(countryISO2: Optional[str] = None) -> Select:
+    stmt = select(*(getattr(SwiftCodeORM, field) for field in EXPORT_FIELDS))
+    if countryISO2 is not None:
+        stmt = stmt.where(SwiftCodeORM.countryISO2 == countryISO2)
+    # yield_per fetches rows in batches instead of loading the whole result
+    return stmt.order_by(SwiftCodeORM.swiftCode).execution_options(
+        yield_per=EXPORT_BATCH_SIZE
+    )
+
+
+def csv_header() -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(EXPORT_FIELDS)
+    return buffer.getvalue().encode()
+
+
+def encode_rows(rows, fmt: str) -> bytes:
+    if fmt == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+    return "".join(
+        json.dumps(row._asdict(), ensure_ascii=False, separators=(",", ":")) + "\n"
+        for row in rows
+    ).encode()
+
+
+# FastAPI closes the request session before a StreamingResponse body is sent, so
+# the generators below keep using the (reopened) session and close it themselves
+
+
+def _stream_sync(db, stmt: Select, fmt: str):
+    try:
+        if fmt == "csv":
+            yield csv_header()
+        for rows in db.execute(stmt).partitions():
+            yield encode_rows(rows, fmt)
+    finally:
+        db.close()
+
+
+async def _stream_async(db: AsyncSession, stmt: Select, fmt: str):
+    try:
+        if fmt == "csv":
+            yield csv_header()
+        result = await db.stream(stmt)
+        async for rows in result.partitions():
+            yield encode_rows(rows, fmt)
+    finally:
+        await db.close()
+
+
+def stream_export(db: DBSession, countryISO2: Optional[str], fmt: str):
+    stmt = export_statement(countryISO2)
+    if isinstance(db, AsyncSession):
+        return _stream_async(db, stmt, fmt)
+    return _stream_sync(db, stmt, fmt)
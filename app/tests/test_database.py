@@ -0,0 +1,441 @@
+import importlib.util
+import logging
+import os
+import signal
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app import config
+from app.database import (
+    TimedQueuePool,
+    create_async_database_engine,
+    create_database_engine,
+    read_only_url,
+    to_async_url,
+)
+from app.crud import (
+    bump_directory_version,
+    ensure_country_summary,
+    get_directory_changes,
+    get_directory_version,
+    update_country_summary,
+    upsert_statement,
+)
+from app import database, export_data_to_db
+from app.directory import SwiftDirectory
+from app.export_data_to_db import (
+    build_snapshot,
+    has_data,
+    import_csv,
+    import_if_changed,
+    refresh_snapshot,
+    reload_server,
+    stored_fingerprint,
+)
+from app.metrics import pool_checkout
+from app.model_orm import (
+    Base,
+    CountrySummaryORM,
+    SwiftCodeORM,
+    ensure_search_index,
+    missing_indexes,
+)
+from app.search import search_swift_codes
+
+CSV_HEADER = "COUNTRY ISO2 CODE,SWIFT CODE,CODE TYPE,NAME,ADDRESS,TOWN NAME,COUNTRY NAME,TIME ZONE\n"
+
+
+@pytest.fixture(name="engine")
+def engine_fixture():
+    return create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+
+
+@pytest.fixture(name="csv_path")
+def csv_path_fixture(tmp_path):
+    path = tmp_path / "swift.csv"
+    path.write_text(
+        CSV_HEADER
+        + "PL,BANKPLPWXXX,BIC11,BANK HQ,HQ ST,WARSZAWA,POLAND,Europe/Warsaw\n"
+        + "PL,BANKPLPW001,BIC11,BANK BRANCH,,WARSZAWA,POLAND,Europe/Warsaw\n"
+        + "na,bankNANXxxx,BIC11,BANK NA,WINDHOEK,WINDHOEK,namibia,Africa/Windhoek\n"
+    )
+    return path
+
+
+# ORM created schema has every index the API relies on
+def test_orm_schema_has_indexes(engine):
+    Base.metadata.create_all(engine)
+    assert missing_indexes(engine) == []
+
+
+# Table written by pandas to_sql(if_exists="replace") is detected
+def test_pandas_schema_is_rejected(engine):
+    pd.DataFrame([{"swiftCode": "BANKPLPWXXX", "countryISO2": "PL"}]).to_sql(
+        "swift_codes", con=engine, index=False
+    )
+    assert ("countryISO2", "swiftCode") in missing_indexes(engine)
+
+
+# A database left by the old pandas loader is not served as is: it counts as
+# empty, so startup imports the CSV in the foreground and rebuilds the table
+def test_pandas_table_is_rebuilt(engine, csv_path):
+    pd.DataFrame(
+        [{"swiftCode": "BANKPLPWXXX", "countryISO2": "PL", "isHeadquarter": True}]
+    ).to_sql("swift_codes", con=engine, index=False)
+    assert not has_data(engine)
+
+    assert import_if_changed(str(csv_path), bind=engine) == 3
+    assert missing_indexes(engine) == []
+    assert has_data(engine)
+
+
+# Loading the CSV keeps primary key and indexes from the ORM
+def test_load_keeps_schema(engine, csv_path):
+    Base.metadata.create_all(engine)
+    import_csv(csv_path, bind=engine)
+    import_csv(csv_path, bind=engine)
+
+    assert missing_indexes(engine) == []
+    assert inspect(engine).get_pk_constraint("swift_codes")["constrained_columns"] == [
+        "swiftCode"
+    ]
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT swiftCode, isHeadquarter, bankCode, address FROM swift_codes "
+            "WHERE countryISO2 = 'PL' ORDER BY swiftCode"
+        ).all()
+    assert rows == [
+        ("BANKPLPW001", 0, "BANKPLPW", None),
+        ("BANKPLPWXXX", 1, "BANKPLPW", "HQ ST"),
+    ]
+
+
+# CSV is read in chunks and normalised the same way as POST
+def test_import_in_chunks(engine, csv_path):
+    assert import_csv(csv_path, bind=engine, chunk_size=1) == 3
+
+    with engine.connect() as conn:
+        row = conn.exec_driver_sql(
+            "SELECT swiftCode, countryISO2, countryName, isHeadquarter "
+            "FROM swift_codes WHERE bankCode = 'BANKNANX'"
+        ).one()
+    assert row == ("BANKNANXXXX", "NA", "NAMIBIA", 1)
+
+
+# Every import bumps the directory version used for ETags
+def test_import_bumps_version(engine, csv_path):
+    import_csv(csv_path, bind=engine)
+    import_csv(csv_path, bind=engine)
+    with Session(engine) as session:
+        epoch, version = get_directory_version(session)
+    assert version == 2
+    assert len(epoch) == 32
+
+
+# Unchanged CSV is not imported again, a changed one is
+def test_import_if_changed(engine, csv_path):
+    assert import_if_changed(str(csv_path), bind=engine) == 3
+    fingerprint = stored_fingerprint(engine)
+    assert fingerprint.startswith(f"{csv_path.stat().st_size}:")
+    assert import_if_changed(str(csv_path), bind=engine) is None
+    assert import_if_changed(str(csv_path), bind=engine, force=True) == 3
+
+    with csv_path.open("a") as file:
+        file.write("DE,BANKDEFFXXX,BIC11,BANK DE,,BERLIN,GERMANY,Europe/Berlin\n")
+    assert import_if_changed(str(csv_path), bind=engine) == 4
+    assert stored_fingerprint(engine) != fingerprint
+    with Session(engine) as session:
+        assert get_directory_version(session)[1] == 3
+
+
+# New rows go to a staging table that replaces swift_codes in one transaction,
+# a failed import leaves the current data in place
+def test_import_swaps_tables(engine, csv_path, tmp_path):
+    import_csv(str(csv_path), bind=engine)
+    fingerprint = stored_fingerprint(engine)
+    assert not inspect(engine).has_table("swift_codes_staging")
+    assert missing_indexes(engine) == []
+
+    broken = tmp_path / "broken.csv"
+    broken.write_text(
+        CSV_HEADER
+        + "DE,BANKDEFFXXX,BIC11,BANK DE,,BERLIN,GERMANY,Europe/Berlin\n"
+        + "DE,BANKDEFFXXX,BIC11,BANK DE,,BERLIN,GERMANY,Europe/Berlin\n"
+    )
+    with pytest.raises(IntegrityError):
+        import_csv(str(broken), bind=engine)
+
+    with engine.connect() as conn:
+        count = conn.exec_driver_sql("SELECT count(*) FROM swift_codes").scalar()
+    assert count == 3
+    assert stored_fingerprint(engine) == fingerprint
+
+
+# The importer rebuilds the search table with the swap, old databases get it
+# on startup
+def test_import_builds_search_index(engine, csv_path):
+    import_csv(str(csv_path), bind=engine)
+    import_csv(str(csv_path), bind=engine)
+    with Session(engine) as session:
+        found = search_swift_codes(session, ["windhoek"], None, 10, 0)
+    assert [item["swiftCode"] for item in found] == ["BANKNANXXXX"]
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE swift_codes_fts")
+    ensure_search_index(engine)
+    with Session(engine) as session:
+        found = search_swift_codes(session, ["bank"], "PL", 10, 0)
+    assert len(found) == 2
+
+
+# The snapshot file written after an import is only used for that version
+def test_import_builds_snapshot(engine, csv_path, tmp_path):
+    snapshot_path = str(tmp_path / "swift.snapshot")
+    import_csv(str(csv_path), bind=engine)
+    assert build_snapshot(snapshot_path, bind=engine) == 3
+    with Session(engine) as session:
+        epoch, version = get_directory_version(session)
+
+    directory = SwiftDirectory()
+    assert not directory.load_file(snapshot_path, epoch, version + 1)
+    assert directory.load_file(snapshot_path, epoch, version)
+    assert len(directory) == 3
+    assert directory.response("BANKPLPWXXX")["branches"] == [
+        {
+            "address": None,
+            "bankName": "BANK BRANCH",
+            "countryISO2": "PL",
+            "isHeadquarter": False,
+            "swiftCode": "BANKPLPW001",
+        }
+    ]
+    assert directory.get("BANKNANXXXX")["countryName"] == "NAMIBIA"
+
+
+def load_gunicorn_conf():
+    path = Path(__file__).parents[2] / "gunicorn.conf.py"
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeServer:
+    log = logging.getLogger("gunicorn.test")
+
+
+# The launcher rebuilds the snapshot file whenever it does not hold the current
+# version, also when the CSV is unchanged and only the API wrote
+def test_import_on_start_refreshes_snapshot(engine, csv_path, tmp_path, monkeypatch):
+    snapshot_path = str(tmp_path / "swift.snapshot")
+    conf = load_gunicorn_conf()
+    monkeypatch.setattr(conf, "SWIFT_CSV_PATH", str(csv_path))
+    monkeypatch.setattr(config, "SNAPSHOT_PATH", snapshot_path)
+    monkeypatch.setattr(database, "engine", engine)
+    started = []
+    monkeypatch.setattr(export_data_to_db, "import_in_background", started.append)
+
+    def file_version():
+        with Session(engine) as session:
+            current = get_directory_version(session)
+        directory = SwiftDirectory()
+        return directory.load_file(snapshot_path, *current), len(directory)
+
+    # Empty database: foreground import, then the file
+    conf.import_on_start(FakeServer())
+    assert started == []
+    assert file_version() == (True, 3)
+
+    # A write through the API, the background import finds the CSV unchanged
+    with Session(engine) as session:
+        session.query(SwiftCodeORM).filter_by(swiftCode="BANKPLPW001").delete()
+        bump_directory_version(session)
+        session.commit()
+    assert file_version()[0] is False
+    conf.import_on_start(FakeServer())
+    assert started == [str(csv_path)]
+    assert file_version() == (True, 2)
+
+    # A current file is left alone
+    inode = os.stat(snapshot_path).st_ino
+    assert refresh_snapshot(snapshot_path, engine) is None
+    assert os.stat(snapshot_path).st_ino == inode
+
+
+# The importer recounts country_summary, an empty one is rebuilt at startup
+def test_import_builds_country_summary(engine, csv_path):
+    import_csv(str(csv_path), bind=engine)
+
+    def summary():
+        with Session(engine) as session:
+            rows = session.query(CountrySummaryORM).order_by("countryISO2").all()
+            return [
+                (row.countryISO2, row.countryName, row.totalCodes, row.headquarters)
+                for row in rows
+            ]
+
+    expected = [("NA", "NAMIBIA", 1, 1), ("PL", "POLAND", 2, 1)]
+    assert summary() == expected
+    with Session(engine) as session:
+        session.query(CountrySummaryORM).delete()
+        session.commit()
+    ensure_country_summary(engine)
+    assert summary() == expected
+
+
+# Version and summary rows are written with one INSERT ... ON CONFLICT each, so
+# concurrent first writes on PostgreSQL cannot both insert the row
+def test_summary_and_version_upserts(engine):
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        for _ in range(2):
+            bump_directory_version(session)
+            update_country_summary(session, {"PL": [2, 1, "POLAND"]})
+        update_country_summary(session, {"DE": [-1, 0, None]})
+        session.commit()
+        assert get_directory_version(session)[1] == 2
+        rows = session.query(CountrySummaryORM).all()
+    assert [(row.countryISO2, row.totalCodes, row.branches) for row in rows] == [
+        ("PL", 4, 2)
+    ]
+
+    statement = upsert_statement(
+        "postgresql", CountrySummaryORM, {"countryISO2": "PL"}, {"totalCodes": 1}
+    )
+    assert 'ON CONFLICT ("countryISO2") DO UPDATE' in str(
+        statement.compile(dialect=postgresql.dialect())
+    )
+
+
+# Every write logs its codes under the new version, a stale worker reads the
+# current rows of those codes. The log is pruned and an import starts over
+# with a new epoch.
+def test_directory_change_log(engine, csv_path, monkeypatch):
+    monkeypatch.setattr(config, "DIRECTORY_CHANGE_RETENTION", 3)
+    import_csv(str(csv_path), bind=engine)
+    with Session(engine) as session:
+        epoch, version = get_directory_version(session)
+        session.query(SwiftCodeORM).filter_by(swiftCode="BANKPLPW001").delete()
+        bump_directory_version(session, deleted=["BANKPLPW001"])
+        session.query(SwiftCodeORM).filter_by(swiftCode="BANKPLPWXXX").update(
+            {"bankName": "RENAMED"}
+        )
+        bump_directory_version(session, upserted=["BANKPLPWXXX"])
+        session.commit()
+
+        rows, deleted = get_directory_changes(session, version, version + 2)
+        assert [(row["swiftCode"], row["bankName"]) for row in rows] == [
+            ("BANKPLPWXXX", "RENAMED")
+        ]
+        assert deleted == ["BANKPLPW001"]
+        assert get_directory_changes(session, version + 1, version + 2)[1] == []
+
+        for _ in range(2):
+            bump_directory_version(session, upserted=["BANKNANXXXX"])
+        session.commit()
+        # Version + 1 is past the retention, the change log starts at version + 2
+        assert get_directory_changes(session, version, version + 4)[1] == []
+
+    import_csv(str(csv_path), bind=engine)
+    with Session(engine) as session:
+        new_epoch, new_version = get_directory_version(session)
+        assert new_epoch != epoch and new_version == version + 5
+        assert get_directory_changes(session, 0, new_version) == ([], [])
+
+
+# After an import the running gunicorn master is told to reload through its pidfile
+def test_reload_server(tmp_path, monkeypatch):
+    signals = []
+    monkeypatch.setattr(
+        export_data_to_db.os, "kill", lambda pid, sig: signals.append((pid, sig))
+    )
+    pidfile = tmp_path / "swift-api.pid"
+    assert reload_server(str(pidfile)) is False
+
+    pidfile.write_text("4242\n")
+    assert reload_server(str(pidfile)) is True
+    assert signals == [(4242, signal.SIGHUP)]
+
+
+# Database backends and pooling ===============================================
+
+
+# PostgreSQL gets an explicitly sized, pre-pinged, recycled pool
+def test_postgres_engine_pool_settings():
+    pytest.importorskip("psycopg2")
+    engine = create_database_engine("postgresql+psycopg2://user:pass@db:5432/swift")
+
+    assert isinstance(engine.pool, TimedQueuePool)
+    assert engine.pool.size() == config.DB_POOL_SIZE
+    assert engine.pool._max_overflow == config.DB_MAX_OVERFLOW
+    assert engine.pool._recycle == config.DB_POOL_RECYCLE
+    assert engine.pool._pre_ping == config.DB_POOL_PRE_PING
+
+
+# Async engines use asyncpg / aiosqlite for the same URL
+def test_async_url():
+    assert (
+        to_async_url("postgresql://user@db/swift").drivername == "postgresql+asyncpg"
+    )
+    assert to_async_url("sqlite:///swift.db").drivername == "sqlite+aiosqlite"
+
+
+def test_async_postgres_engine():
+    pytest.importorskip("asyncpg")
+    engine = create_async_database_engine("postgresql://user:pass@db:5432/swift")
+    assert engine.url.drivername == "postgresql+asyncpg"
+    assert engine.sync_engine.pool.size() == config.DB_POOL_SIZE
+
+
+# Waiting for a pooled connection is recorded
+def test_pool_checkout_is_timed(tmp_path):
+    pool_checkout.reset()
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'swift.db'}")
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+
+    stats = pool_checkout.as_dict()
+    assert stats["checkouts"] == 2
+    assert stats["wait_seconds_max"] >= 0
+
+
+# SQLite tuning =================================================================
+
+
+# Writer connections switch on WAL and the configured cache and mmap sizes
+def test_sqlite_pragmas(tmp_path):
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'swift.db'}")
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        assert (
+            conn.exec_driver_sql("PRAGMA cache_size").scalar()
+            == config.SQLITE_CACHE_SIZE
+        )
+
+
+# Read-only engine can read the file but never write to it
+def test_sqlite_read_only_engine(tmp_path):
+    url = f"sqlite:///{tmp_path / 'swift.db'}"
+    engine = create_database_engine(url)
+    Base.metadata.create_all(engine)
+    read_engine = create_database_engine(read_only_url(url))
+
+    with read_engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT count(*) FROM swift_codes").scalar() == 0
+        with pytest.raises(OperationalError, match="readonly"):
+            conn.exec_driver_sql(
+                "INSERT INTO swift_codes (swiftCode, countryISO2) "
+                "VALUES ('BANKPLPWXXX', 'PL')"
+            )
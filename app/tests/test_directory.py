@@ -0,0 +1,117 @@
+from app.columnar import ColumnarStore
+from app.directory import SwiftDirectory
+from app.snapshot_file import read_snapshot
+
+
+def code_row(swift_code: str, **fields) -> dict:
+    return {
+        "address": "1 MAIN STREET",
+        "bankName": f"BANK {swift_code[:8]}",
+        "countryISO2": swift_code[4:6],
+        "countryName": "POLAND",
+        "isHeadquarter": swift_code.endswith("XXX"),
+        "swiftCode": swift_code,
+        **fields,
+    }
+
+
+ROWS = [
+    code_row("AAAAPLPW001", address=None),
+    code_row("AAAAPLPWXXX", bankName="ŁÓDŹ BANK"),
+    code_row("BBBBPLPW001"),
+    code_row("BBBBPLPWXXX"),
+]
+
+
+def loaded_directory(rows: list[dict]) -> SwiftDirectory:
+    directory = SwiftDirectory()
+    directory.use(ColumnarStore.build(rows))
+    return directory
+
+
+# Rows come back with the same values, NULLs and non-ASCII names included
+def test_columnar_round_trip():
+    store = ColumnarStore.build(ROWS)
+
+    assert len(store) == 4
+    assert [store.row(i) for i in range(len(store))] == ROWS
+    assert store.find("BBBBPLPWXXX") == 3
+    assert store.find("BBBBPLPW002") == -1
+    assert store.find("ŁÓDŹPLPWXXX") == -1
+    assert list(store.prefix_rows("AAAA")) == [0, 1]
+    assert list(store.prefix_rows("CCCC")) == []
+    # Repeated strings are stored once
+    assert len(store.strings) == 5
+
+
+# Writes after loading shadow the stored rows
+def test_directory_overlay():
+    directory = loaded_directory(ROWS)
+    directory.add(code_row("AAAAPLPW002"))
+    directory.add(code_row("AAAAPLPW001", address="NEW ADDRESS"))
+    directory.remove("BBBBPLPW001")
+    directory.remove("NOSWIFTCODE")
+
+    assert len(directory) == 4
+    assert directory.get("AAAAPLPW001")["address"] == "NEW ADDRESS"
+    assert directory.get("BBBBPLPW001") is None
+    assert [item["swiftCode"] for item in directory.branches("AAAAPLPW")] == [
+        "AAAAPLPW001",
+        "AAAAPLPW002",
+    ]
+    assert directory.response("BBBBPLPWXXX")["branches"] == []
+    assert [item["swiftCode"] for item in directory.prefix("AAAA", 10)] == [
+        "AAAAPLPW001",
+        "AAAAPLPW002",
+        "AAAAPLPWXXX",
+    ]
+
+    directory.remove("AAAAPLPW002")
+    directory.add(code_row("BBBBPLPW001"))
+    assert len(directory) == 4
+    assert [item["swiftCode"] for item in directory.prefix("B", 10)] == [
+        "BBBBPLPW001",
+        "BBBBPLPWXXX",
+    ]
+
+
+# The mapped file serves the same rows, including the ones kept outside the
+# columns, and a file that is not a snapshot is ignored
+def test_snapshot_file_round_trip(tmp_path):
+    path = str(tmp_path / "swift.snapshot")
+    directory = SwiftDirectory()
+    outside = code_row("ŁÓDŹPLPWXXX")
+    directory.use(
+        ColumnarStore.build(ROWS), {outside["swiftCode"]: outside}, ("a" * 32, 7)
+    )
+    directory.save(path)
+
+    mapped = SwiftDirectory()
+    assert mapped.load_file(path, "a" * 32, 7)
+    assert len(mapped) == 5
+    assert [mapped.get(item["swiftCode"]) for item in ROWS] == ROWS
+    assert mapped.get("ŁÓDŹPLPWXXX") == outside
+    assert [item["swiftCode"] for item in mapped.prefix("AAAA", 10)] == [
+        "AAAAPLPW001",
+        "AAAAPLPWXXX",
+    ]
+
+    empty = str(tmp_path / "empty.snapshot")
+    empty_directory = SwiftDirectory()
+    empty_directory.use(ColumnarStore.build([]), version=("0", 0))
+    empty_directory.save(empty)
+    assert len(read_snapshot(empty).store) == 0
+
+    (tmp_path / "swift.snapshot").write_bytes(b"not a snapshot" * 10)
+    assert read_snapshot(path) is None
+    assert read_snapshot(str(tmp_path / "missing.snapshot")) is None
+
+
+# Only writes that follow the loaded version keep the copy current
+def test_directory_record_change():
+    directory = SwiftDirectory()
+    directory.use(ColumnarStore.build(ROWS), version=("0", 0))
+    directory.record_change("e" * 32, 1)
+    assert directory.version == ("e" * 32, 1)
+    directory.record_change("e" * 32, 3)
+    assert directory.version == ("e" * 32, 1)
@@ -1,36 +1,85 @@
+import asyncio
+import json
+import os
 from fastapi.testclient import TestClient
 import pytest
-from app.main import app
-from app.routers.swift import get_db
-from sqlalchemy.orm import Session
-from sqlalchemy import create_engine
-from sqlalchemy.pool import StaticPool
-from app.model_orm import Base
+from app.main import app, reset_state, warm_up
+from app.routers.swift import get_db, get_read_db
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool, StaticPool
+from app.model_orm import Base, SwiftCodeORM
+from app.models import Swift_Code
+from app.directory import SwiftDirectory, directory
+from app.http_cache import country_cache, directory_version, warm_country_cache
+from app import config, crud, database, http_cache, main, profiling
+from app.database import create_database_engine
 
 
-# Tests are done on in memory database
+# Tests are done on in memory database (sync mode) and on a temporary file
+# database shared by a sync and an aiosqlite engine (async mode)
+
+
+@pytest.fixture(name="db_mode", params=["sync", "async"])
+def db_mode_fixture(request):
+    return request.param
 
 
 @pytest.fixture(name="session")
-def session_fixture():
-    engine = create_engine(
-        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
-    )
+def session_fixture(db_mode, tmp_path):
+    if db_mode == "sync":
+        engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+    else:
+        engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
     Base.metadata.create_all(engine)
     with Session(engine) as session:
         yield session
+    engine.dispose()
 
 
 @pytest.fixture(name="client")
-def client_fixture(session: Session):
-    def get_session_override():
-        return session
+def client_fixture(session: Session, db_mode, tmp_path):
+    if db_mode == "sync":
+
+        def get_session_override():
+            return session
+
+    else:
+        async_engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=NullPool
+        )
+
+        async def get_session_override():
+            async with AsyncSession(async_engine, expire_on_commit=False) as db:
+                yield db
 
     app.dependency_overrides[get_db] = get_session_override
+    app.dependency_overrides[get_read_db] = get_session_override
 
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
+    directory.clear()
+    directory_version.invalidate()
+    country_cache.clear()
+
+
+# warm_up() and the lifespan use app.database directly, point it at a temporary
+# file instead of app/swift.db
+@pytest.fixture(name="app_engine")
+def app_engine_fixture(tmp_path, monkeypatch):
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    for module in (main, database):
+        monkeypatch.setattr(module, "engine", engine)
+        monkeypatch.setattr(module, "SessionLocal", session_local)
+    monkeypatch.setattr(database, "read_engine", engine)
+    monkeypatch.setattr(http_cache, "SessionLocal", session_local)
+    yield engine
+    engine.dispose()
 
 
 # Full OK data
@@ -603,3 +652,869 @@ def test_get_hq_with_branches(client: TestClient):
     assert data["isHeadquarter"] is True
     assert isinstance(data["branches"], list)
     assert len(data["branches"]) == 1
+
+
+# Memory snapshot ==========================================================
+
+
+def post_hq_with_branch(client: TestClient):
+    client.post(
+        "/v1/swift-codes",
+        json={
+            "swiftCode": "BANKTESTXXX",
+            "bankName": "Bank HQ",
+            "address": "HQ St",
+            "countryISO2": "PL",
+            "countryName": "POLAND",
+            "isHeadquarter": True,
+        },
+    )
+    client.post(
+        "/v1/swift-codes",
+        json={
+            "swiftCode": "BANKTEST001",
+            "bankName": "Branch",
+            "address": "Branch St",
+            "countryISO2": "PL",
+            "countryName": "POLAND",
+            "isHeadquarter": False,
+        },
+    )
+
+
+# GET is answered from the snapshot even when the row is gone from the database
+def test_get_served_from_snapshot(client: TestClient, session: Session):
+    post_hq_with_branch(client)
+    directory.load(session)
+    session.query(SwiftCodeORM).delete()
+    session.commit()
+
+    response = client.get("/v1/swift-codes/banktestxxx")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["swiftCode"] == "BANKTESTXXX"
+    assert [b["swiftCode"] for b in data["branches"]] == ["BANKTEST001"]
+
+    assert client.get("/v1/swift-codes/NOSWIFTCODE").status_code == 404
+
+
+# POST and DELETE keep the snapshot in sync
+def test_snapshot_follows_post_and_delete(client: TestClient, session: Session):
+    directory.load(session)
+    post_hq_with_branch(client)
+
+    data = client.get("/v1/swift-codes/BANKTESTXXX").json()
+    assert len(data["branches"]) == 1
+
+    assert client.delete("/v1/swift-codes/BANKTEST001").status_code == 200
+    data = client.get("/v1/swift-codes/BANKTESTXXX").json()
+    assert data["branches"] == []
+    assert client.get("/v1/swift-codes/BANKTEST001").status_code == 404
+
+
+# A write made by another worker makes this worker's snapshot stale: reads go
+# to the database (under the new ETag) until an update caught up
+def test_stale_snapshot_falls_back(client: TestClient, session: Session, monkeypatch):
+    post_hq_with_branch(client)
+    directory.load(session)
+    updates = []
+    monkeypatch.setattr(http_cache, "start_directory_update", lambda: updates.append(1))
+
+    new_code = Swift_Code(**bulk_item("BANKTEST002"))
+    other_worker_write(session, lambda: crud.add_swift(session, new_code))
+    response = client.get("/v1/swift-codes/BANKTESTXXX")
+    assert [b["swiftCode"] for b in response.json()["branches"]] == [
+        "BANKTEST001",
+        "BANKTEST002",
+    ]
+    assert response.headers["etag"] != http_cache.make_etag(*directory.version)
+    prefix = client.get("/v1/swift-codes/prefix/BANKTEST").json()["results"]
+    assert [item["swiftCode"] for item in prefix] == [
+        "BANKTEST001",
+        "BANKTEST002",
+        "BANKTESTXXX",
+    ]
+    assert updates
+
+
+# A stale worker applies only the codes written since its version and keeps the
+# store it started from, an import (new epoch) loads a new copy
+def test_stale_snapshot_catches_up(client: TestClient, session: Session, monkeypatch):
+    post_hq_with_branch(client)
+    directory.load(session)
+    store = directory._store
+    session_local = sessionmaker(bind=session.get_bind())
+    monkeypatch.setattr(http_cache, "SessionLocal", session_local)
+    monkeypatch.setattr(config, "SNAPSHOT_PATH", "")
+
+    new_code = Swift_Code(**bulk_item("BANKTEST002"))
+    other_worker_write(session, lambda: crud.add_swift(session, new_code))
+    other_worker_write(session, lambda: crud.delete_swift_code(session, "BANKTEST001"))
+    asyncio.run(http_cache.update_directory())
+    assert directory._store is store
+    assert directory.version == crud.get_directory_version(session)
+    assert [item["swiftCode"] for item in directory.prefix("BANKTEST", 10)] == [
+        "BANKTEST002",
+        "BANKTESTXXX",
+    ]
+
+    other_worker_write(session, lambda: crud.start_directory_epoch(session))
+    asyncio.run(http_cache.update_directory())
+    assert directory._store is not store
+    assert directory.version == crud.get_directory_version(session)
+    assert directory.get("BANKTEST002") is not None
+
+
+def other_worker_write(session: Session, write):
+    write()
+    session.commit()
+    directory_version.invalidate()
+
+
+# Snapshot can be switched off to use the database path
+def test_snapshot_disabled(client: TestClient, session: Session, monkeypatch):
+    monkeypatch.setattr(config, "USE_MEMORY_SNAPSHOT", False)
+    post_hq_with_branch(client)
+    directory.load(session)
+    session.query(SwiftCodeORM).delete()
+    session.commit()
+
+    assert client.get("/v1/swift-codes/BANKTESTXXX").status_code == 404
+
+
+# Startup only reads the snapshot file, a stale one is left to the importer
+def test_startup_does_not_write_snapshot(app_engine, tmp_path, monkeypatch):
+    path = tmp_path / "swift.snapshot"
+    path.write_bytes(b"stale")
+    monkeypatch.setattr(config, "USE_MEMORY_SNAPSHOT", True)
+    monkeypatch.setattr(config, "SNAPSHOT_PATH", str(path))
+    directory.clear()
+
+    warm_up()
+    assert directory.loaded
+    assert path.read_bytes() == b"stale"
+    reset_state()
+
+
+# Bank code column ==========================================================
+
+
+# POST fills bankCode and the HQ branch lookup uses the composite index
+def test_bank_code_index_used(client: TestClient, session: Session):
+    post_hq_with_branch(client)
+    assert session.get(SwiftCodeORM, "BANKTEST001").bankCode == "BANKTEST"
+
+    plan = session.execute(
+        text(
+            "EXPLAIN QUERY PLAN SELECT * FROM swift_codes "
+            "WHERE bankCode = 'BANKTEST' AND isHeadquarter = 0"
+        )
+    ).all()
+    assert "ix_swift_codes_bankCode_isHeadquarter" in " ".join(
+        str(row[-1]) for row in plan
+    )
+
+
+# Pool checkout wait is only exposed through /metrics
+def test_pool_stats_in_metrics(client: TestClient):
+    assert client.get("/pool-stats").status_code == 404
+    body = client.get("/metrics").text
+    assert "swift_db_pool_checkout_wait_seconds_sum" in body
+    assert "swift_db_pool_checkout_wait_seconds_max" in body
+
+
+# Country pagination ==========================================================
+
+
+def post_country_codes(client: TestClient, codes: list[str]):
+    for code in codes:
+        client.post(
+            "/v1/swift-codes",
+            json={
+                "swiftCode": code,
+                "bankName": "Bank",
+                "address": "Street",
+                "countryISO2": "PL",
+                "countryName": "POLAND",
+                "isHeadquarter": code.endswith("XXX"),
+            },
+        )
+
+
+# Pages follow swiftCode order and end with next_cursor = None
+def test_country_keyset_pagination(client: TestClient):
+    post_country_codes(client, ["BANKPLPW003", "BANKPLPWXXX", "BANKPLPW001"])
+
+    page1 = client.get("/v1/swift-codes/country/PL?limit=2").json()
+    assert page1["countryName"] == "POLAND"
+    assert [c["swiftCode"] for c in page1["swiftCodes"]] == [
+        "BANKPLPW001",
+        "BANKPLPW003",
+    ]
+    assert page1["next_cursor"] == "BANKPLPW003"
+
+    page2 = client.get(
+        f"/v1/swift-codes/country/PL?limit=2&after={page1['next_cursor']}"
+    ).json()
+    assert [c["swiftCode"] for c in page2["swiftCodes"]] == ["BANKPLPWXXX"]
+    assert page2["next_cursor"] is None
+
+
+# Projection returns only the requested fields (plus swiftCode)
+def test_country_fields_projection(client: TestClient):
+    post_country_codes(client, ["BANKPLPWXXX", "BANKPLPW001"])
+
+    data = client.get("/v1/swift-codes/country/pl?fields=isHeadquarter").json()
+    assert data["swiftCodes"] == [
+        {"isHeadquarter": False, "swiftCode": "BANKPLPW001"},
+        {"isHeadquarter": True, "swiftCode": "BANKPLPWXXX"},
+    ]
+
+    response = client.get("/v1/swift-codes/country/PL?fields=password")
+    assert response.status_code == 422
+    assert client.get("/v1/swift-codes/country/DE?limit=5").status_code == 404
+
+
+# Streaming export ============================================================
+
+
+# NDJSON export streams one JSON object per line in swiftCode order
+def test_export_ndjson(client: TestClient):
+    post_country_codes(client, ["BANKPLPWXXX", "BANKPLPW001"])
+    post_hq_with_branch(client)
+
+    response = client.get("/v1/swift-codes/export?country=pl")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["swiftCode"] for row in rows] == [
+        "BANKPLPW001",
+        "BANKPLPWXXX",
+        "BANKTEST001",
+        "BANKTESTXXX",
+    ]
+    assert rows[1]["isHeadquarter"] is True
+    assert rows[1]["countryName"] == "POLAND"
+
+    assert client.get("/v1/swift-codes/export?country=DE").text == ""
+
+
+# CSV export of the whole directory starts with a header row
+def test_export_csv(client: TestClient):
+    post_country_codes(client, ["BANKPLPWXXX"])
+
+    response = client.get("/v1/swift-codes/export?format=csv")
+    assert response.status_code == 200
+    assert response.text.splitlines() == [
+        "swiftCode,bankName,address,countryISO2,countryName,isHeadquarter",
+        "BANKPLPWXXX,Bank,Street,PL,POLAND,True",
+    ]
+
+
+# Bulk lookup =================================================================
+
+
+# Many codes resolved in one request, in request order, with not-found markers
+def test_bulk_lookup(client: TestClient):
+    post_hq_with_branch(client)
+
+    response = client.post(
+        "/v1/swift-codes/lookup",
+        json={"swiftCodes": ["banktestxxx", "NOSWIFTCODE", "BANKTEST001"]},
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [(r["swiftCode"], r["found"]) for r in results] == [
+        ("BANKTESTXXX", True),
+        ("NOSWIFTCODE", False),
+        ("BANKTEST001", True),
+    ]
+    assert [b["swiftCode"] for b in results[0]["data"]["branches"]] == ["BANKTEST001"]
+    assert results[1]["data"] is None
+    assert "branches" not in results[2]["data"]
+
+
+# Same answers from the memory snapshot
+def test_bulk_lookup_snapshot(client: TestClient, session: Session):
+    post_hq_with_branch(client)
+    directory.load(session)
+
+    results = client.post(
+        "/v1/swift-codes/lookup", json={"swiftCodes": ["BANKTESTXXX", "NOSWIFTCODE"]}
+    ).json()["results"]
+    assert results[0]["data"]["branches"][0]["swiftCode"] == "BANKTEST001"
+    assert results[1]["found"] is False
+
+
+# Repeated and missing codes get the same results from the database and from
+# the snapshot
+@pytest.mark.parametrize("snapshot", [False, True])
+def test_bulk_lookup_duplicates(client: TestClient, session: Session, snapshot):
+    post_hq_with_branch(client)
+    if snapshot:
+        directory.load(session)
+
+    results = client.post(
+        "/v1/swift-codes/lookup",
+        json={"swiftCodes": ["BANKTEST001", "NOSWIFTCODE", "banktest001", "NOSWIFTCODE"]},
+    ).json()["results"]
+    assert [(r["swiftCode"], r["found"]) for r in results] == [
+        ("BANKTEST001", True),
+        ("NOSWIFTCODE", False),
+        ("BANKTEST001", True),
+        ("NOSWIFTCODE", False),
+    ]
+    assert results[0]["data"] == results[2]["data"]
+    assert results[0]["data"]["bankName"] == "Branch"
+    assert results[1]["data"] is None and results[3]["data"] is None
+
+
+# Codes in the batch are validated
+def test_bulk_lookup_validation(client: TestClient):
+    assert (
+        client.post("/v1/swift-codes/lookup", json={"swiftCodes": []}).status_code
+        == 422
+    )
+    assert (
+        client.post("/v1/swift-codes/lookup", json={"swiftCodes": ["XYZ"]}).status_code
+        == 422
+    )
+
+
+# Bulk create / delete ========================================================
+
+
+def bulk_item(code: str, bank_name: str = "Bank") -> dict:
+    return {
+        "swiftCode": code,
+        "bankName": bank_name,
+        "address": "Street",
+        "countryISO2": "PL",
+        "countryName": "POLAND",
+        "isHeadquarter": code.endswith("XXX"),
+    }
+
+
+# Conflicts fail the whole batch by default
+def test_bulk_create_fail(client: TestClient):
+    post_country_codes(client, ["BANKPLPW001"])
+
+    response = client.post(
+        "/v1/swift-codes/bulk",
+        json={"swiftCodes": [bulk_item("BANKPLPWXXX"), bulk_item("bankplpw001")]},
+    )
+    assert response.status_code == 409
+    assert response.json()["detail"]["swiftCodes"] == ["BANKPLPW001"]
+    assert client.get("/v1/swift-codes/BANKPLPWXXX").status_code == 404
+
+
+# skip keeps existing rows, upsert overwrites them
+def test_bulk_create_skip_and_upsert(client: TestClient):
+    post_country_codes(client, ["BANKPLPW001"])
+    body = {"swiftCodes": [bulk_item("BANKPLPWXXX"), bulk_item("BANKPLPW001", "New")]}
+
+    response = client.post("/v1/swift-codes/bulk?on_conflict=skip", json=body)
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"swiftCode": "BANKPLPWXXX", "status": "created"},
+        {"swiftCode": "BANKPLPW001", "status": "skipped"},
+    ]
+    assert client.get("/v1/swift-codes/BANKPLPW001").json()["bankName"] == "Bank"
+
+    response = client.post("/v1/swift-codes/bulk?on_conflict=upsert", json=body)
+    assert [r["status"] for r in response.json()["results"]] == ["updated", "updated"]
+    assert client.get("/v1/swift-codes/BANKPLPW001").json()["bankName"] == "New"
+
+
+# A code repeated in one batch is a validation error, not a conflict
+def test_bulk_create_duplicates_rejected(client: TestClient):
+    response = client.post(
+        "/v1/swift-codes/bulk",
+        json={"swiftCodes": [bulk_item("BANKPLPWXXX"), bulk_item("bankplpwxxx")]},
+    )
+    assert response.status_code == 422
+    assert "BANKPLPWXXX" in response.text
+    assert client.get("/v1/swift-codes/BANKPLPWXXX").status_code == 404
+
+
+# A code inserted by another request after the existence check is reported
+# as a conflict instead of failing with an IntegrityError
+def test_bulk_create_concurrent_insert(client: TestClient, monkeypatch):
+    post_country_codes(client, ["BANKPLPW001"])
+    existing_codes = crud.existing_codes
+    calls = []
+
+    def missed_once(db, swift_codes):
+        calls.append(swift_codes)
+        return {} if len(calls) == 1 else existing_codes(db, swift_codes)
+
+    monkeypatch.setattr(crud, "existing_codes", missed_once)
+    response = client.post(
+        "/v1/swift-codes/bulk",
+        json={"swiftCodes": [bulk_item("BANKPLPWXXX"), bulk_item("BANKPLPW001")]},
+    )
+    assert response.status_code == 409
+    assert response.json()["detail"]["swiftCodes"] == ["BANKPLPW001"]
+    assert client.get("/v1/swift-codes/BANKPLPWXXX").status_code == 404
+    assert len(calls) == 2
+
+
+# Bulk delete reports deleted and missing codes
+def test_bulk_delete(client: TestClient, session: Session):
+    post_country_codes(client, ["BANKPLPWXXX", "BANKPLPW001"])
+    directory.load(session)
+
+    response = client.request(
+        "DELETE",
+        "/v1/swift-codes/bulk",
+        json={"swiftCodes": ["bankplpw001", "NOSWIFTCODE"]},
+    )
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"swiftCode": "BANKPLPW001", "status": "deleted"},
+        {"swiftCode": "NOSWIFTCODE", "status": "not_found"},
+    ]
+    assert client.get("/v1/swift-codes/BANKPLPW001").status_code == 404
+    assert client.get("/v1/swift-codes/BANKPLPWXXX").json()["branches"] == []
+
+
+# HTTP caching ================================================================
+
+
+# Read endpoints send an ETag and answer If-None-Match with 304
+def test_etag_not_modified(client: TestClient):
+    post_hq_with_branch(client)
+
+    for url in ["/v1/swift-codes/BANKTESTXXX", "/v1/swift-codes/country/PL"]:
+        response = client.get(url)
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        assert response.headers["cache-control"].startswith("public, max-age=")
+
+        cached = client.get(url, headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == etag
+
+
+# Every write changes the ETag
+def test_etag_changes_after_write(client: TestClient):
+    post_hq_with_branch(client)
+    etag = client.get("/v1/swift-codes/BANKTESTXXX").headers["etag"]
+
+    client.delete("/v1/swift-codes/BANKTEST001")
+    response = client.get("/v1/swift-codes/BANKTESTXXX", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["branches"] == []
+
+
+# Country response cache ======================================================
+
+
+# Second request is served from the pre-serialised cache
+def test_country_cache_hit(client: TestClient, session: Session):
+    post_country_codes(client, ["BANKPLPWXXX"])
+    first = client.get("/v1/swift-codes/country/PL")
+    assert "PL" in country_cache
+
+    # Not visible through the API, so the cached bytes are still returned
+    session.query(SwiftCodeORM).delete()
+    session.commit()
+    second = client.get("/v1/swift-codes/country/pl")
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.headers["content-type"] == "application/json"
+
+
+# A write only drops the country it touched
+def test_country_cache_targeted_invalidation(client: TestClient):
+    post_country_codes(client, ["BANKPLPWXXX"])
+    client.post("/v1/swift-codes", json={**bulk_item("BANKDEFFXXX"), "countryISO2": "DE"})
+    client.get("/v1/swift-codes/country/PL")
+    client.get("/v1/swift-codes/country/DE")
+    assert "PL" in country_cache and "DE" in country_cache
+
+    client.post("/v1/swift-codes", json=bulk_item("BANKPLPW001"))
+    assert "PL" not in country_cache
+    assert "DE" in country_cache
+    data = client.get("/v1/swift-codes/country/PL").json()
+    assert len(data["swiftCodes"]) == 2
+
+
+# Warm up builds every country up front
+def test_country_cache_warm(client: TestClient, session: Session):
+    post_country_codes(client, ["BANKPLPWXXX"])
+    warm_country_cache(session)
+    assert "PL" in country_cache
+    assert client.get("/v1/swift-codes/country/PL").json()["countryName"] == "POLAND"
+
+
+# Direct JSON serialisation ===================================================
+
+
+# HQ response keeps the model field order, branches may have null fields
+def test_hq_response_shape(client: TestClient, monkeypatch):
+    monkeypatch.setattr(config, "VALIDATE_RESPONSES", True)
+    post_hq_with_branch(client)
+    client.post(
+        "/v1/swift-codes",
+        json={"swiftCode": "BANKTEST002", "countryISO2": "PL", "isHeadquarter": False},
+    )
+
+    data = client.get("/v1/swift-codes/BANKTESTXXX").json()
+    assert list(data) == [
+        "address",
+        "bankName",
+        "countryISO2",
+        "countryName",
+        "isHeadquarter",
+        "swiftCode",
+        "branches",
+    ]
+    branches = sorted(data["branches"], key=lambda b: b["swiftCode"])
+    assert list(branches[0]) == [
+        "address",
+        "bankName",
+        "countryISO2",
+        "isHeadquarter",
+        "swiftCode",
+    ]
+    assert branches[1]["bankName"] is None
+
+
+# Metrics ======================================================================
+
+
+# Requests are counted under the route template, not the concrete path
+def test_metrics_endpoint(client: TestClient):
+    post_hq_with_branch(client)
+    client.get("/v1/swift-codes/BANKTESTXXX")
+    client.get("/v1/swift-codes/NOTEXIST123")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    # Series are per worker process
+    worker = f'worker="{os.getpid()}"'
+    route = "/v1/swift-codes/{swift_code}"
+    assert (
+        f'swift_http_requests_total{{method="GET",route="{route}",status="200",{worker}}}'
+        in body
+    )
+    assert (
+        f'swift_http_requests_total{{method="GET",route="{route}",status="404",{worker}}}'
+        in body
+    )
+    assert "NOTEXIST123" not in body
+    assert "swift_http_request_duration_seconds_bucket" in body
+    assert f'swift_db_queries_per_request_count{{route="/v1/swift-codes",{worker}}}' in body
+    assert f"swift_db_pool_checkout_wait_seconds_count{{{worker}}}" in body
+
+
+# Profiling ====================================================================
+
+
+def server_timing_names(response) -> list[str]:
+    return [
+        metric.split(";")[0].strip()
+        for metric in response.headers["server-timing"].split(",")
+    ]
+
+
+# Profiled requests get a Server-Timing breakdown with the SQL query plans
+def test_profile_swift_code(client: TestClient, monkeypatch):
+    monkeypatch.setattr(config, "PROFILING_ENABLED", True)
+    post_hq_with_branch(client)
+
+    response = client.get("/v1/swift-codes/BANKTESTXXX", headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    names = server_timing_names(response)
+    assert {"etag", "hydrate", "encode", "total"} <= set(names)
+    assert "sql-1" in names
+    assert "USING INDEX" in response.headers["server-timing"]
+
+    response = client.get("/v1/swift-codes/country/PL?profile=1")
+    assert response.status_code == 200
+    assert {"hydrate", "validate", "encode"} <= set(server_timing_names(response))
+
+    assert "server-timing" not in client.get("/v1/swift-codes/BANKTESTXXX").headers
+
+
+def test_profile_disabled(client: TestClient):
+    post_hq_with_branch(client)
+    response = client.get("/v1/swift-codes/BANKTESTXXX", headers={"X-Profile": "1"})
+    assert "server-timing" not in response.headers
+
+
+# With PROFILE_DIR set the request is also dumped as cProfile stats
+def test_profile_dump(client: TestClient, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(config, "PROFILE_DIR", str(tmp_path / "profiles"))
+    post_hq_with_branch(client)
+
+    client.get("/v1/swift-codes/BANKTESTXXX?profile=1")
+
+    files = sorted(path.suffix for path in (tmp_path / "profiles").iterdir())
+    assert files == [".json", ".prof"]
+    dump = json.loads(next((tmp_path / "profiles").glob("*.json")).read_text())
+    assert dump["statements"][0]["plan"]
+
+
+# While another request is being profiled the request is served with its
+# timings, only the dump is skipped
+def test_profile_dump_one_at_a_time(client: TestClient, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(config, "PROFILE_DIR", str(tmp_path / "profiles"))
+    post_hq_with_branch(client)
+
+    with profiling._profiler_lock:
+        response = client.get("/v1/swift-codes/BANKTESTXXX?profile=1")
+    assert response.status_code == 200
+    assert "server-timing" in response.headers
+    assert not (tmp_path / "profiles").exists()
+
+    client.get("/v1/swift-codes/BANKTESTXXX?profile=1")
+    assert len(list((tmp_path / "profiles").iterdir())) == 2
+
+
+# Workers forked from a warmed up gunicorn master keep the inherited snapshot
+def test_lifespan_keeps_preloaded_snapshot(
+    client: TestClient, session: Session, app_engine
+):
+    post_hq_with_branch(client)
+    directory.load(session)
+    preloaded = directory._store
+
+    with TestClient(app):
+        assert directory._store is preloaded
+        assert directory.get("BANKTESTXXX") is not None
+    assert not directory.loaded
+
+
+# Full-text search =============================================================
+
+
+def search_codes(client: TestClient, **params) -> list[str]:
+    response = client.get("/v1/swift-codes/search", params=params)
+    assert response.status_code == 200
+    return [item["swiftCode"] for item in response.json()["results"]]
+
+
+# Bank name hits rank above address hits
+def test_search_ranking(client: TestClient):
+    client.post(
+        "/v1/swift-codes/bulk",
+        json={
+            "swiftCodes": [
+                {**bulk_item("ALFAPLPWXXX", "Alfa Bank"), "address": "Kredytowa 1"},
+                {**bulk_item("KREDPLPWXXX", "Kredyt Bank"), "address": "Alfa St"},
+                {**bulk_item("OTHRDEFFXXX", "Alfa Bank"), "countryISO2": "DE"},
+            ]
+        },
+    )
+
+    assert search_codes(client, q="kredyt") == ["KREDPLPWXXX"]
+    assert search_codes(client, q="kredytowa") == ["ALFAPLPWXXX"]
+    assert search_codes(client, q="ALFA", country="pl") == [
+        "ALFAPLPWXXX",
+        "KREDPLPWXXX",
+    ]
+    assert search_codes(client, q="alfa bank", country="DE") == ["OTHRDEFFXXX"]
+    # FTS syntax in the query is treated as plain words, OR has to be in the name
+    assert search_codes(client, q='alfa" OR "kredyt') == []
+
+
+def test_search_pagination(client: TestClient):
+    client.post(
+        "/v1/swift-codes/bulk",
+        json={
+            "swiftCodes": [bulk_item(f"BANKPLPW{i:03d}", "Pekao") for i in range(5)]
+        },
+    )
+
+    params = {"q": "pekao", "limit": 2}
+    first = client.get("/v1/swift-codes/search", params=params).json()
+    assert first["limit"] == 2 and first["offset"] == 0
+    assert len(first["results"]) == 2
+    assert first["next_offset"] == 2
+    seen = [item["swiftCode"] for item in first["results"]]
+    offset = first["next_offset"]
+    while offset is not None:
+        page = client.get(
+            "/v1/swift-codes/search", params={**params, "offset": offset}
+        ).json()
+        seen += [item["swiftCode"] for item in page["results"]]
+        offset = page["next_offset"]
+    assert sorted(seen) == [f"BANKPLPW{i:03d}" for i in range(5)]
+
+
+# Only the first SEARCH_RANK_WINDOW matches are ranked and paging stops there
+def test_search_rank_window(client: TestClient, monkeypatch):
+    monkeypatch.setattr(config, "SEARCH_RANK_WINDOW", 3)
+    address_hits = [
+        {**bulk_item(f"BANKPLPW{i:03d}"), "address": "Pekao St"} for i in range(4)
+    ]
+    client.post(
+        "/v1/swift-codes/bulk",
+        json={
+            "swiftCodes": [
+                address_hits[0],
+                bulk_item("PEKAPLPWXXX", "Pekao"),
+                *address_hits[1:],
+            ]
+        },
+    )
+
+    def page(offset: int) -> dict:
+        params = {"q": "pekao", "limit": 2, "offset": offset}
+        return client.get("/v1/swift-codes/search", params=params).json()
+
+    first = page(0)
+    assert [item["swiftCode"] for item in first["results"]] == [
+        "PEKAPLPWXXX",
+        "BANKPLPW000",
+    ]
+    assert first["next_offset"] == 2
+    last = page(2)
+    assert [item["swiftCode"] for item in last["results"]] == ["BANKPLPW001"]
+    assert last["next_offset"] is None
+    assert page(4) == {"results": [], "limit": 2, "offset": 4, "next_offset": None}
+
+
+# The index follows add, delete, upsert and bulk delete
+def test_search_index_follows_writes(client: TestClient):
+    post_hq_with_branch(client)
+    assert search_codes(client, q="branch") == ["BANKTEST001"]
+
+    client.delete("/v1/swift-codes/BANKTEST001")
+    assert search_codes(client, q="branch") == []
+
+    client.post(
+        "/v1/swift-codes/bulk?on_conflict=upsert",
+        json={"swiftCodes": [bulk_item("BANKTESTXXX", "Renamed Bank")]},
+    )
+    assert search_codes(client, q="renamed") == ["BANKTESTXXX"]
+    assert search_codes(client, q="hq") == []
+
+    client.request(
+        "DELETE", "/v1/swift-codes/bulk", json={"swiftCodes": ["BANKTESTXXX"]}
+    )
+    assert search_codes(client, q="renamed") == []
+
+
+def test_search_validation(client: TestClient):
+    assert client.get("/v1/swift-codes/search").status_code == 422
+    assert client.get("/v1/swift-codes/search", params={"q": "*"}).status_code == 422
+    response = client.get("/v1/swift-codes/search", params={"q": "bank", "limit": 0})
+    assert response.status_code == 422
+
+
+# Prefix lookup ================================================================
+
+
+def prefix_codes(client: TestClient, partial: str, **params) -> list[str]:
+    response = client.get(f"/v1/swift-codes/prefix/{partial}", params=params)
+    assert response.status_code == 200
+    return [item["swiftCode"] for item in response.json()["results"]]
+
+
+# Without the snapshot the prefix is a primary key range query
+def test_prefix_from_database(client: TestClient):
+    post_hq_with_branch(client)
+    post_country_codes(client, ["BANKTESU001", "BANKTES0001"])
+
+    response = client.get("/v1/swift-codes/prefix/banktest")
+    assert response.json()["results"] == [
+        {"swiftCode": "BANKTEST001", "bankName": "Branch", "isHeadquarter": False},
+        {"swiftCode": "BANKTESTXXX", "bankName": "Bank HQ", "isHeadquarter": True},
+    ]
+    assert prefix_codes(client, "BANKTES", limit=2) == ["BANKTES0001", "BANKTEST001"]
+    assert prefix_codes(client, "NOPE") == []
+
+
+# The sorted snapshot gives the same answers and follows every kind of write
+def test_prefix_from_snapshot(client: TestClient, session: Session):
+    post_hq_with_branch(client)
+    directory.load(session)
+    post_country_codes(client, ["BANKTESU001"])
+    client.delete("/v1/swift-codes/BANKTEST001")
+    client.post(
+        "/v1/swift-codes/bulk",
+        json={"swiftCodes": [bulk_item(f"BANKTEST{i:03d}") for i in range(100, 200)]},
+    )
+    client.request(
+        "DELETE",
+        "/v1/swift-codes/bulk",
+        json={"swiftCodes": [f"BANKTEST{i:03d}" for i in range(100, 190)]},
+    )
+    session.query(SwiftCodeORM).delete()
+    session.commit()
+
+    assert prefix_codes(client, "BANKTEST", limit=100) == [
+        *(f"BANKTEST{i:03d}" for i in range(190, 200)),
+        "BANKTESTXXX",
+    ]
+    assert prefix_codes(client, "BANKTES", limit=1) == ["BANKTEST190"]
+    assert prefix_codes(client, "BANKTESU001") == ["BANKTESU001"]
+
+
+def test_prefix_validation(client: TestClient):
+    assert client.get("/v1/swift-codes/prefix/BAN").status_code == 422
+    assert client.get("/v1/swift-codes/prefix/BANKTESTXXXX").status_code == 422
+    assert client.get("/v1/swift-codes/prefix/BANK?limit=0").status_code == 422
+
+
+# Country summary =============================================================
+
+
+def country_counts(client: TestClient, iso2: str):
+    response = client.get(f"/v1/countries/{iso2}")
+    if response.status_code == 404:
+        return None
+    data = response.json()
+    fields = ("countryName", "totalCodes", "headquarters", "branches")
+    return tuple(data[field] for field in fields)
+
+
+# Every kind of write keeps the per-country counts in step
+def test_country_summary_follows_writes(client: TestClient):
+    assert country_counts(client, "PL") is None
+    post_hq_with_branch(client)
+    assert country_counts(client, "pl") == ("POLAND", 2, 1, 1)
+
+    client.post(
+        "/v1/swift-codes/bulk",
+        json={"swiftCodes": [bulk_item("BANKPLPWXXX"), bulk_item("BANKPLPW001")]},
+    )
+    assert country_counts(client, "PL") == ("POLAND", 4, 2, 2)
+
+    # An upsert moving a code to another country updates both
+    moved = {**bulk_item("BANKTEST001"), "countryISO2": "DE", "countryName": "GERMANY"}
+    client.post("/v1/swift-codes/bulk?on_conflict=upsert", json={"swiftCodes": [moved]})
+    assert country_counts(client, "PL") == ("POLAND", 3, 2, 1)
+    assert country_counts(client, "DE") == ("GERMANY", 1, 0, 1)
+
+    client.delete("/v1/swift-codes/BANKTEST001")
+    assert country_counts(client, "DE") is None
+    client.request(
+        "DELETE",
+        "/v1/swift-codes/bulk",
+        json={"swiftCodes": ["BANKPLPWXXX", "BANKPLPW001"]},
+    )
+    assert country_counts(client, "PL") == ("POLAND", 1, 1, 0)
+
+    response = client.get("/v1/countries")
+    assert response.status_code == 200
+    assert [item["countryISO2"] for item in response.json()["countries"]] == ["PL"]
+    assert response.headers["etag"]
+
+
+def test_country_summary_validation(client: TestClient):
+    assert client.get("/v1/countries/POL").status_code == 422
+    assert client.get("/v1/countries/P1").status_code == 422
+    response = client.get("/v1/countries/XX")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Country code does not exists"}
@@ -0,0 +1,54 @@
+from sqlalchemy import create_engine
+
+from app.metrics import (
+    Counter,
+    Histogram,
+    RequestDBStats,
+    instrument_engine,
+    request_db_stats,
+)
+
+
+def test_histogram_render():
+    histogram = Histogram("latency_seconds", "Latency", ("route",), (0.1, 1.0))
+    histogram.observe(("/a",), 0.05)
+    histogram.observe(("/a",), 0.5)
+    histogram.observe(("/a",), 3.0)
+
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/a"} 3' in lines
+    assert 'latency_seconds_sum{route="/a"} 3.55' in lines
+
+    lines = histogram.render((("worker", "7"),))
+    assert 'latency_seconds_bucket{route="/a",worker="7",le="0.1"} 1' in lines
+    assert 'latency_seconds_count{route="/a",worker="7"} 3' in lines
+
+
+# Label values are escaped per the text exposition format
+def test_counter_escapes_labels():
+    counter = Counter("requests_total", "Requests", ("route",))
+    counter.inc(('say "hi"\\',))
+    assert 'requests_total{route="say \\"hi\\"\\\\"} 1.0' in counter.render()
+
+
+# SQL statements are added to the stats of the current request only
+def test_instrumented_engine_counts_queries():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine, "test")
+
+    stats = RequestDBStats()
+    token = request_db_stats.set(stats)
+    try:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("SELECT 1")
+            conn.exec_driver_sql("SELECT 2")
+    finally:
+        request_db_stats.reset(token)
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 3")
+
+    assert stats.queries == 2
+    assert stats.seconds > 0
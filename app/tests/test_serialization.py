@@ -0,0 +1,56 @@
+import pytest
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.main import app
+from app.routers.swift import router
+from app import config
+from app.serialization import default_response_class, json_response
+
+pytest.importorskip("orjson")
+
+PAYLOADS = [
+    {"Hi": "Welcome"},
+    {
+        "address": "BAHNHOFSTRASSE 45 ZÜRICH",
+        "bankName": "UBS SWITZERLAND AG",
+        "countryISO2": "CH",
+        "countryName": "SWITZERLAND",
+        "isHeadquarter": True,
+        "swiftCode": "UBSWCHZHXXX",
+        "branches": [
+            {
+                "address": None,
+                "bankName": "ŁÓDŹ \"OFFICE\" \\ 1\n",
+                "countryISO2": "CH",
+                "isHeadquarter": False,
+                "swiftCode": "UBSWCHZH80A",
+            }
+        ],
+    },
+    {"results": [{"swiftCode": "NOSWIFTCODE", "found": False, "data": None}]},
+    {"detail": [{"loc": ["path", "swift_code"], "ctx": {"min_length": 11}}]},
+    {"pool": "Pool size: 5", "checkouts": 3, "wait_seconds_total": 0.25},
+]
+
+
+# orjson renders exactly the same bytes as the stdlib JSONResponse
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_orjson_byte_compatible(payload):
+    assert ORJSONResponse(payload).body == JSONResponse(payload).body
+
+
+# Rows serialised directly produce the same bytes too
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_json_response_byte_compatible(payload):
+    assert json_response(payload).body == JSONResponse(payload).body
+
+
+def test_orjson_is_default(monkeypatch):
+    # The app picks its class at import, whatever ORJSON_RESPONSES was then
+    assert app.router.default_response_class is default_response_class()
+    assert router.default_response_class is default_response_class()
+
+    monkeypatch.setattr(config, "ORJSON_RESPONSES", True)
+    assert default_response_class() is ORJSONResponse
+    monkeypatch.setattr(config, "ORJSON_RESPONSES", False)
+    assert default_response_class() is JSONResponse
@@ -0,0 +1,139 @@
+"""CPU time per GET /v1/swift-codes/{hq} for headquarters with many branches.
+
+Compares the original response path (ORM rows -> Swift_Code -> model_dump ->
+Swift_with_Branches -> response_model validation -> jsonable_encoder -> json)
+with the current one (column rows -> dicts -> one to_json call).
+
+    python -m benchmarks.hq_serialisation [--branches 10 100 1000] [--json]
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Union
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app import crud
+from app.model_orm import Base, SwiftCodeORM
+from app.models import Swift_Code, Swift_with_Branches, Switf_Branch
+from app.serialization import json_response
+
+response_adapter = TypeAdapter(Union[Swift_Code, Swift_with_Branches])
+
+
+def seed(db: Session, bank: str, branches: int):
+    db.add(
+        SwiftCodeORM(
+            swiftCode=f"{bank}XXX",
+            bankName="BENCH BANK HQ",
+            address="1 MAIN STREET",
+            countryISO2="PL",
+            countryName="POLAND",
+            isHeadquarter=True,
+            bankCode=bank,
+        )
+    )
+    db.add_all(
+        SwiftCodeORM(
+            swiftCode=f"{bank}{i:03d}",
+            bankName="BENCH BANK BRANCH",
+            address=f"{i} SIDE STREET",
+            countryISO2="PL",
+            countryName="POLAND",
+            isHeadquarter=False,
+            bankCode=bank,
+        )
+        for i in range(branches)
+    )
+    db.commit()
+
+
+def before(db: Session, swift_code: str) -> bytes:
+    # Handler body as it was before the change
+    code = db.query(SwiftCodeORM).filter_by(swiftCode=swift_code).first()
+    branches = (
+        db.query(SwiftCodeORM)
+        .filter(
+            SwiftCodeORM.bankCode == code.swiftCode[:8],
+            SwiftCodeORM.isHeadquarter == False,
+        )
+        .all()
+    )
+    branches_data = [
+        Switf_Branch.model_validate(branch, from_attributes=True) for branch in branches
+    ]
+    base_hq = Swift_Code.model_validate(code, from_attributes=True)
+    result = Swift_with_Branches(**base_hq.model_dump(), branches=branches_data)
+
+    # What FastAPI does with response_model=Union[Swift_Code, Swift_with_Branches]
+    validated = response_adapter.validate_python(result.model_dump())
+    content = response_adapter.dump_python(validated, mode="json")
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def after(db: Session, swift_code: str) -> bytes:
+    return json_response(crud.get_swift_code(db, swift_code)).body
+
+
+def measure(fn, db: Session, swift_code: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        db.expunge_all()
+        start = time.process_time()
+        fn(db, swift_code)
+        timings.append(time.process_time() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--branches", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="machine readable output")
+    args = parser.parse_args()
+
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+
+    results = []
+    with Session(engine) as db:
+        for i, branches in enumerate(args.branches):
+            bank = f"BNCH{i:02d}PL"
+            seed(db, bank, branches)
+            swift_code = f"{bank}XXX"
+            assert json.loads(before(db, swift_code)) == json.loads(
+                after(db, swift_code)
+            )
+            old = measure(before, db, swift_code, args.repeat)
+            new = measure(after, db, swift_code, args.repeat)
+            results.append(
+                {
+                    "branches": branches,
+                    "before_ms": old * 1000,
+                    "after_ms": new * 1000,
+                    "speedup": old / new if new else None,
+                }
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'branches':>8} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for row in results:
+        print(
+            f"{row['branches']:>8} {row['before_ms']:>10.3f} "
+            f"{row['after_ms']:>10.3f} {row['speedup']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Memory held by the in-memory directory, per million codes.
+
+Loads the same synthetic directory three ways and reports the memory each one
+keeps alive (tracemalloc, after garbage collection):
+
+    orm       list of SwiftCodeORM objects
+    dicts     dict of row dicts keyed by code (the directory before columns)
+    columnar  ColumnarStore, as app.directory uses it
+
+    python -m benchmarks.memory [--size 200000] [--json]
+"""
+
+import argparse
+import csv
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Iterator
+
+from app.columnar import ColumnarStore
+from app.export_data_to_db import read_swift_csv
+from app.model_orm import SwiftCodeORM
+from benchmarks.synthetic import CSV_HEADER, generate_rows
+
+
+def write_sorted_csv(path: str, size: int):
+    # The store is built from rows sorted by code, like the database query
+    rows = sorted(generate_rows(size), key=lambda row: row[1])
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_HEADER)
+        writer.writerows(rows)
+
+
+def stream(path: str) -> Iterator[dict]:
+    for chunk in read_swift_csv(path):
+        yield from chunk
+
+
+def load_orm(path: str):
+    return [SwiftCodeORM(**item) for item in stream(path)]
+
+
+def load_dicts(path: str):
+    return {
+        item["swiftCode"]: {
+            key: value for key, value in item.items() if key != "bankCode"
+        }
+        for item in stream(path)
+    }
+
+
+def load_columnar(path: str):
+    return ColumnarStore.build(stream(path))
+
+
+LOADERS: dict[str, Callable] = {
+    "orm": load_orm,
+    "dicts": load_dicts,
+    "columnar": load_columnar,
+}
+
+
+def measure(load: Callable, path: str) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    loaded = load(path)
+    seconds = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del loaded
+    return {
+        "bytes": current - baseline,
+        "peak_bytes": peak - baseline,
+        "seconds": seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "directory.csv")
+        write_sorted_csv(path, args.size)
+        results = {name: measure(load, path) for name, load in LOADERS.items()}
+
+    scale = 1_000_000 / args.size
+    if args.json:
+        print(json.dumps({"size": args.size, "results": results}, indent=2))
+        return
+    print(f"{args.size} codes, MB per million codes (load time under tracemalloc)")
+    for name, result in results.items():
+        print(
+            f"{name:>10}  {result['bytes'] * scale / 2**20:8.1f} MB  "
+            f"peak {result['peak_bytes'] * scale / 2**20:8.1f} MB  "
+            f"{result['seconds']:6.1f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""Latency and throughput of the SWIFT API endpoints on a synthetic directory.
+
+In-process (default): builds a temporary SQLite database from a synthetic CSV
+and calls the app through TestClient.
+
+    python -m benchmarks.run --size 10000 --output results.json
+
+Against a running server, loaded beforehand with the same synthetic CSV:
+
+    python -m benchmarks.synthetic --size 1000000 --out app/data/synthetic.csv
+    python app/export_data_to_db.py app/data/synthetic.csv
+    uvicorn app.main:app --port 8080
+    python -m benchmarks.run --size 1000000 --url http://localhost:8080 --concurrency 8
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+
+from benchmarks.synthetic import DirectorySample, generate_rows, write_csv
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def new_code_body(number: int) -> dict:
+    return {
+        "swiftCode": f"ZZ{number:06d}BCH",
+        "bankName": "BENCHMARK BANK",
+        "address": "1 BENCH STREET",
+        "countryISO2": "PL",
+        "countryName": "POLAND",
+        "isHeadquarter": False,
+    }
+
+
+def scenarios(sample: DirectorySample, requests: int) -> dict:
+    # name -> (method, url for request i, json body for request i, ok status)
+    new_codes = [new_code_body(i) for i in range(requests)]
+    return {
+        "get_branch": (
+            "GET",
+            lambda i: f"/v1/swift-codes/{sample.branch_codes[i % len(sample.branch_codes)]}",
+            None,
+            200,
+        ),
+        "get_hq": (
+            "GET",
+            lambda i: f"/v1/swift-codes/{sample.hq_codes[i % len(sample.hq_codes)]}",
+            None,
+            200,
+        ),
+        "get_hq_many_branches": (
+            "GET",
+            lambda i: f"/v1/swift-codes/{sample.biggest_hq}",
+            None,
+            200,
+        ),
+        "get_large_country": (
+            "GET",
+            lambda i: f"/v1/swift-codes/country/{sample.largest_country}",
+            None,
+            200,
+        ),
+        # Word in every bank name: bounded by SEARCH_RANK_WINDOW
+        "search_common": (
+            "GET",
+            lambda i: f"/v1/swift-codes/search?q=bank&offset={i % 5 * 20}",
+            None,
+            200,
+        ),
+        "search_town": (
+            "GET",
+            lambda i: f"/v1/swift-codes/search?q=town+{i % 500}",
+            None,
+            200,
+        ),
+        "search_selective": (
+            "GET",
+            lambda i: "/v1/swift-codes/search?q="
+            f"{sample.hq_codes[i % len(sample.hq_codes)][:8]}",
+            None,
+            200,
+        ),
+        "post": ("POST", lambda i: "/v1/swift-codes", lambda i: new_codes[i], 201),
+        "delete": (
+            "DELETE",
+            lambda i: f"/v1/swift-codes/{new_codes[i]['swiftCode']}",
+            None,
+            200,
+        ),
+    }
+
+
+def run_scenario(clients: list, scenario, requests: int) -> dict:
+    method, url, body, ok_status = scenario
+    latencies = [0.0] * requests
+    errors = 0
+
+    def call(i: int, client):
+        start = time.perf_counter()
+        response = client.request(method, url(i), json=body(i) if body else None)
+        latencies[i] = time.perf_counter() - start
+        return response.status_code == ok_status
+
+    started = time.perf_counter()
+    if len(clients) == 1:
+        results = [call(i, clients[0]) for i in range(requests)]
+    else:
+        with ThreadPoolExecutor(len(clients)) as pool:
+            results = list(
+                pool.map(lambda i: call(i, clients[i % len(clients)]), range(requests))
+            )
+    elapsed = time.perf_counter() - started
+    errors = results.count(False)
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "throughput_rps": requests / elapsed if elapsed else 0.0,
+    }
+
+
+@contextmanager
+def in_process_clients(size: int, seed: int, concurrency: int):
+    from fastapi.testclient import TestClient
+    from sqlalchemy.orm import sessionmaker
+
+    from app import config
+    from app.database import create_database_engine, get_db, get_read_db
+    from app.directory import directory
+    from app.export_data_to_db import import_csv
+    from app.http_cache import country_cache, directory_version
+    from app.main import app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "synthetic.csv"
+        sample = write_csv(str(csv_path), size, seed)
+        engine = create_database_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        import_csv(str(csv_path), bind=engine)
+        BenchSession = sessionmaker(bind=engine, autoflush=False)
+
+        def get_bench_db():
+            db = BenchSession()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = get_bench_db
+        app.dependency_overrides[get_read_db] = get_bench_db
+        if config.USE_MEMORY_SNAPSHOT:
+            with BenchSession() as db:
+                directory.load(db)
+        try:
+            yield [TestClient(app) for _ in range(concurrency)], sample
+        finally:
+            app.dependency_overrides.clear()
+            directory.clear()
+            country_cache.clear()
+            directory_version.invalidate()
+            engine.dispose()
+
+
+@contextmanager
+def http_clients(url: str, size: int, seed: int, concurrency: int):
+    # Regenerating with the same size and seed gives the codes the server holds
+    sample = DirectorySample()
+    for _ in generate_rows(size, seed, sample):
+        pass
+    clients = [httpx.Client(base_url=url, timeout=60) for _ in range(concurrency)]
+    try:
+        yield clients, sample
+    finally:
+        for client in clients:
+            client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10_000, help="directory size")
+    parser.add_argument("--seed", type=int, default=2025)
+    parser.add_argument("--requests", type=int, default=500, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--url", help="benchmark a running server instead")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.url:
+        clients = http_clients(args.url, args.size, args.seed, args.concurrency)
+    else:
+        clients = in_process_clients(args.size, args.seed, args.concurrency)
+
+    results = {}
+    with clients as (client_list, sample):
+        for name, scenario in scenarios(sample, args.requests).items():
+            results[name] = run_scenario(client_list, scenario, args.requests)
+
+    report = {
+        "commit": git_commit(),
+        "mode": "http" if args.url else "in-process",
+        "size": args.size,
+        "seed": args.seed,
+        "concurrency": args.concurrency,
+        "largest_country": sample.largest_country,
+        "biggest_hq_branches": sample.biggest_hq_branches,
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    print(
+        f"{'scenario':<22} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>9} {'errors':>6}"
+    )
+    for name, row in results.items():
+        print(
+            f"{name:<22} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+            f"{row['throughput_rps']:>9.0f} {row['errors']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
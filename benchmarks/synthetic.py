@@ -0,0 +1,170 @@
+"""Synthetic SWIFT directory in the format of the intern CSV.
+
+Countries follow a Zipf-like skew (a few countries hold most codes). Most banks
+have a handful of branches, and a few have hundreds (Pareto tail).
+
+    python -m benchmarks.synthetic --size 1000000 --out app/data/synthetic.csv
+"""
+
+import argparse
+import csv
+import random
+import string
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterator
+
+CSV_HEADER = [
+    "COUNTRY ISO2 CODE",
+    "SWIFT CODE",
+    "CODE TYPE",
+    "NAME",
+    "ADDRESS",
+    "TOWN NAME",
+    "COUNTRY NAME",
+    "TIME ZONE",
+]
+
+COUNTRIES = [
+    ("US", "UNITED STATES", "America/New_York"),
+    ("DE", "GERMANY", "Europe/Berlin"),
+    ("GB", "UNITED KINGDOM", "Europe/London"),
+    ("FR", "FRANCE", "Europe/Paris"),
+    ("IT", "ITALY", "Europe/Rome"),
+    ("CN", "CHINA", "Asia/Shanghai"),
+    ("JP", "JAPAN", "Asia/Tokyo"),
+    ("ES", "SPAIN", "Europe/Madrid"),
+    ("CH", "SWITZERLAND", "Europe/Zurich"),
+    ("PL", "POLAND", "Europe/Warsaw"),
+    ("BR", "BRAZIL", "America/Sao_Paulo"),
+    ("IN", "INDIA", "Asia/Kolkata"),
+    ("CA", "CANADA", "America/Toronto"),
+    ("NL", "NETHERLANDS", "Europe/Amsterdam"),
+    ("AU", "AUSTRALIA", "Australia/Sydney"),
+    ("AT", "AUSTRIA", "Europe/Vienna"),
+    ("SE", "SWEDEN", "Europe/Stockholm"),
+    ("BE", "BELGIUM", "Europe/Brussels"),
+    ("TR", "TURKEY", "Europe/Istanbul"),
+    ("MX", "MEXICO", "America/Mexico_City"),
+    ("ZA", "SOUTH AFRICA", "Africa/Johannesburg"),
+    ("NA", "NAMIBIA", "Africa/Windhoek"),
+    ("LV", "LATVIA", "Europe/Riga"),
+    ("MT", "MALTA", "Europe/Malta"),
+    ("MC", "MONACO", "Europe/Monaco"),
+]
+COUNTRY_WEIGHTS = [1 / rank for rank in range(1, len(COUNTRIES) + 1)]
+MAX_BRANCHES = 999
+
+LETTERS = string.ascii_uppercase
+ALNUM = string.ascii_uppercase + string.digits
+
+
+@dataclass
+class DirectorySample:
+    # Codes picked while generating, used by the benchmark to build requests
+    size: int = 0
+    headquarters: int = 0
+    branch_codes: list[str] = field(default_factory=list)
+    hq_codes: list[str] = field(default_factory=list)
+    biggest_hq: str = ""
+    biggest_hq_branches: int = -1
+    countries: Counter = field(default_factory=Counter)
+
+    @property
+    def largest_country(self) -> str:
+        return self.countries.most_common(1)[0][0]
+
+
+def institution_code(number: int) -> str:
+    code = ""
+    for _ in range(4):
+        number, digit = divmod(number, 26)
+        code = LETTERS[digit] + code
+    return code
+
+
+def generate_rows(
+    size: int, seed: int = 2025, sample: DirectorySample = None
+) -> Iterator[list[str]]:
+    rng = random.Random(seed)
+    sample = sample if sample is not None else DirectorySample()
+    bank_number = 0
+    branches_seen = 0
+    while sample.size < size:
+        iso2, country_name, time_zone = rng.choices(COUNTRIES, COUNTRY_WEIGHTS)[0]
+        # institution code is unique per bank, location keeps it unique past 26^4
+        location = ALNUM[bank_number // 26**4 % 36] + rng.choice(ALNUM)
+        bank = f"{institution_code(bank_number)}{iso2}{location}"
+        bank_number += 1
+        town = f"TOWN {rng.randrange(500)}"
+        branches = min(int(rng.paretovariate(1.16)) - 1, MAX_BRANCHES)
+        branches = min(branches, size - sample.size - 1)
+
+        hq_code = f"{bank}XXX"
+        yield [
+            iso2,
+            hq_code,
+            "BIC11",
+            f"BANK {bank} HEADQUARTERS",
+            f"{rng.randrange(1, 300)} MAIN STREET, {town}",
+            town,
+            country_name,
+            time_zone,
+        ]
+        sample.size += 1
+        sample.headquarters += 1
+        sample.countries[iso2] += 1 + branches
+        if len(sample.hq_codes) < 1000:
+            sample.hq_codes.append(hq_code)
+        if branches > sample.biggest_hq_branches:
+            sample.biggest_hq, sample.biggest_hq_branches = hq_code, branches
+
+        for number in range(branches):
+            branch_code = f"{bank}{number:03d}"
+            yield [
+                iso2,
+                branch_code,
+                "BIC11",
+                f"BANK {bank} BRANCH {number}",
+                f"{rng.randrange(1, 300)} SIDE STREET, {town}",
+                town,
+                country_name,
+                time_zone,
+            ]
+            sample.size += 1
+            branches_seen += 1
+            # reservoir sampling keeps 1000 evenly spread branch codes
+            if len(sample.branch_codes) < 1000:
+                sample.branch_codes.append(branch_code)
+            else:
+                slot = rng.randrange(branches_seen)
+                if slot < 1000:
+                    sample.branch_codes[slot] = branch_code
+
+
+def write_csv(path: str, size: int, seed: int = 2025) -> DirectorySample:
+    sample = DirectorySample()
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_HEADER)
+        writer.writerows(generate_rows(size, seed, sample))
+    return sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=2025)
+    parser.add_argument("--out", default="app/data/synthetic.csv")
+    args = parser.parse_args()
+
+    sample = write_csv(args.out, args.size, args.seed)
+    print(
+        f"Wrote {sample.size} codes ({sample.headquarters} headquarters) to "
+        f"{args.out}; largest country {sample.largest_country}, biggest HQ "
+        f"{sample.biggest_hq} with {sample.biggest_hq_branches} branches"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Production launcher: gunicorn -c gunicorn.conf.py app.main:app
+#
+# The app is imported and warmed up (directory snapshot, country cache) once in
+# the master, then forked, so every worker starts with the data already loaded
+# and shares its memory pages copy-on-write. Send SIGHUP to the master (the
+# importer does it through the pidfile) to load a new dataset: the master warms
+# up again and replaces the workers gracefully.
+#
+# On start the CSV is imported first if the database is empty. Otherwise the
+# workers serve the existing data right away and the import runs in the
+# background; it is skipped when the file is unchanged. The snapshot file is
+# rebuilt before the warm-up whenever it does not hold the current version.
+import gc
+import multiprocessing
+import os
+
+from app.config import IMPORT_ON_START, SERVER_PIDFILE, SWIFT_CSV_PATH
+
+bind = os.getenv("BIND", "0.0.0.0:8080")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+pidfile = SERVER_PIDFILE
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+accesslog = "-"
+
+
+def dispose_engines(close: bool):
+    from app import database
+
+    for engine in (database.engine, database.read_engine):
+        engine.dispose(close=close)
+    for async_engine in (database.async_engine, database.async_read_engine):
+        if async_engine is not None:
+            async_engine.sync_engine.dispose(close=close)
+
+
+def warm_master(server):
+    from app.main import warm_up
+
+    warm_up()
+    # The master does not serve requests, its connections are not needed
+    dispose_engines(close=True)
+    # Keep the loaded objects out of the collector so workers do not touch
+    # (and copy) their pages during garbage collection
+    gc.collect()
+    gc.freeze()
+    server.log.info("Directory loaded in the master, forking workers")
+
+
+def import_on_start(server):
+    from app import database
+    from app.export_data_to_db import has_data, import_if_changed, import_in_background
+
+    bind = database.engine
+    if not os.path.exists(SWIFT_CSV_PATH):
+        server.log.warning("%s not found, serving the existing data", SWIFT_CSV_PATH)
+    elif has_data(bind):
+        import_in_background(SWIFT_CSV_PATH)
+        server.log.info("Checking %s for changes in the background", SWIFT_CSV_PATH)
+    else:
+        rows = import_if_changed(SWIFT_CSV_PATH, bind)
+        server.log.info("Imported %s SWIFT codes from %s", rows, SWIFT_CSV_PATH)
+    refresh_snapshot_file(server)
+
+
+def refresh_snapshot_file(server):
+    # Writes through the API since the file was built make it stale, the
+    # master then maps the rebuilt file instead of reading the table
+    from app import config, database
+    from app.export_data_to_db import refresh_snapshot
+
+    path = config.SNAPSHOT_PATH
+    try:
+        rows = refresh_snapshot(path, database.engine)
+    except OSError as error:
+        server.log.warning("Could not write %s, reading the table: %s", path, error)
+        return
+    if rows is not None:
+        server.log.info("Wrote snapshot %s with %s SWIFT codes", path, rows)
+
+
+def when_ready(server):
+    if IMPORT_ON_START:
+        import_on_start(server)
+    else:
+        refresh_snapshot_file(server)
+    warm_master(server)
+
+
+def on_reload(server):
+    from app.main import reset_state
+
+    gc.unfreeze()
+    reset_state()
+    warm_master(server)
+
+
+def post_fork(server, worker):
+    # Connections inherited from the master belong to it, drop them without
+    # closing so the master's sockets/files are left alone
+    dispose_engines(close=False)